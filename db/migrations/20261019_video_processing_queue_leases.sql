@@ -0,0 +1,212 @@
+-- Leases for transcription rows in video_processing_queue.
+-- Whisper nodes claim a row atomically, renew the lease while they work, and a
+-- row whose lease runs out (crashed or partitioned node) goes back to pending,
+-- or fails once max_retries is spent.
+
+ALTER TABLE public.video_processing_queue
+  ADD COLUMN IF NOT EXISTS lease_owner text,
+  ADD COLUMN IF NOT EXISTS lease_expires_at timestamptz;
+
+CREATE INDEX IF NOT EXISTS idx_video_queue_transcribe_claim
+  ON public.video_processing_queue USING btree (status, created_at)
+  WHERE current_step = 'transcribe';
+
+CREATE INDEX IF NOT EXISTS idx_video_queue_lease_expires
+  ON public.video_processing_queue USING btree (lease_expires_at)
+  WHERE status = 'processing' AND lease_expires_at IS NOT NULL;
+
+
+-- Pull mode: claim the oldest pending transcription whose media is on MEGA.
+-- Returns no row when nothing is claimable.
+CREATE OR REPLACE FUNCTION public.claim_video_processing_job(
+  p_worker_id text,
+  p_lease_seconds integer
+)
+RETURNS TABLE (
+  queue_id bigint,
+  attachment_id bigint,
+  media_url text,
+  retry_count integer
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+DECLARE
+  claimed_id bigint;
+BEGIN
+  IF p_worker_id IS NULL OR length(p_worker_id) = 0 THEN
+    RAISE EXCEPTION 'worker id is required';
+  END IF;
+  IF p_lease_seconds IS NULL OR p_lease_seconds <= 0 THEN
+    RAISE EXCEPTION 'lease seconds must be positive';
+  END IF;
+
+  -- Re-queue expired leases; rows another node is already re-queueing are skipped.
+  -- Their transcribe step goes back to pending (or failed) with them.
+  WITH requeued AS (
+    UPDATE public.video_processing_queue q
+    SET
+      status = CASE
+        WHEN coalesce(q.retry_count, 0) + 1 >= coalesce(q.max_retries, 3) THEN 'failed'
+        ELSE 'pending'
+      END,
+      retry_count = coalesce(q.retry_count, 0) + 1,
+      error_message = 'transcription lease held by ' || q.lease_owner || ' expired',
+      last_error_at = now(),
+      lease_owner = NULL,
+      lease_expires_at = NULL,
+      updated_at = now()
+    WHERE q.id IN (
+      SELECT expired.id
+      FROM public.video_processing_queue expired
+      WHERE expired.current_step = 'transcribe'
+        AND expired.status = 'processing'
+        AND expired.lease_expires_at < now()
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING q.id, q.status, q.error_message
+  )
+  UPDATE public.video_processing_steps s
+  SET
+    status = r.status,
+    started_at = CASE WHEN r.status = 'pending' THEN NULL ELSE s.started_at END,
+    completed_at = CASE WHEN r.status = 'failed' THEN now() ELSE NULL END,
+    error_message = r.error_message,
+    updated_at = now()
+  FROM requeued r
+  WHERE s.queue_id = r.id AND s.step_name = 'transcribe';
+
+  SELECT q.id INTO claimed_id
+  FROM public.video_processing_queue q
+  JOIN public.course_attachments a ON a.id = q.attachment_id
+  WHERE q.current_step = 'transcribe'
+    AND q.status = 'pending'
+    AND NOT a.is_deleted
+    AND a.url ~ '^https://(www\.)?mega\.nz/'
+  ORDER BY q.created_at, q.id
+  LIMIT 1
+  FOR UPDATE OF q SKIP LOCKED;
+
+  IF claimed_id IS NULL THEN
+    RETURN;
+  END IF;
+
+  UPDATE public.video_processing_queue q
+  SET
+    status = 'processing',
+    progress_percentage = 65,
+    started_at = now(),
+    error_message = NULL,
+    lease_owner = p_worker_id,
+    lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+    updated_at = now()
+  WHERE q.id = claimed_id;
+
+  UPDATE public.video_processing_steps s
+  SET status = 'processing', started_at = now(), error_message = NULL, updated_at = now()
+  WHERE s.queue_id = claimed_id AND s.step_name = 'transcribe';
+
+  RETURN QUERY
+  SELECT q.id, q.attachment_id, a.url, q.retry_count
+  FROM public.video_processing_queue q
+  JOIN public.course_attachments a ON a.id = q.attachment_id
+  WHERE q.id = claimed_id;
+END;
+$$;
+
+
+-- Push mode: claim a specific row sent to POST /transcribe. Returns false while any
+-- worker, the caller included, holds an unexpired lease on it, so the row is already
+-- being handled and a duplicate push must not start a second job.
+CREATE OR REPLACE FUNCTION public.claim_video_processing_queue(
+  p_queue_id bigint,
+  p_attachment_id bigint,
+  p_worker_id text,
+  p_lease_seconds integer
+)
+RETURNS boolean
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+DECLARE
+  current_expiry timestamptz;
+BEGIN
+  IF p_worker_id IS NULL OR length(p_worker_id) = 0 THEN
+    RAISE EXCEPTION 'worker id is required';
+  END IF;
+  IF p_lease_seconds IS NULL OR p_lease_seconds <= 0 THEN
+    RAISE EXCEPTION 'lease seconds must be positive';
+  END IF;
+
+  SELECT q.lease_expires_at INTO current_expiry
+  FROM public.video_processing_queue q
+  WHERE q.id = p_queue_id AND q.attachment_id = p_attachment_id
+  FOR UPDATE;
+
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'queue and attachment do not match';
+  END IF;
+  IF current_expiry >= now() THEN
+    RETURN false;
+  END IF;
+
+  UPDATE public.video_processing_queue q
+  SET
+    status = 'processing',
+    current_step = 'transcribe',
+    progress_percentage = 65,
+    started_at = now(),
+    error_message = NULL,
+    lease_owner = p_worker_id,
+    lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+    updated_at = now()
+  WHERE q.id = p_queue_id;
+
+  UPDATE public.video_processing_steps s
+  SET status = 'processing', started_at = now(), error_message = NULL, updated_at = now()
+  WHERE s.queue_id = p_queue_id AND s.step_name = 'transcribe';
+
+  RETURN true;
+END;
+$$;
+
+
+-- Heartbeat. Returns false once the lease was lost (expired and re-queued, or the
+-- row reached a terminal state), which tells the worker to abandon the job.
+CREATE OR REPLACE FUNCTION public.renew_video_processing_lease(
+  p_queue_id bigint,
+  p_worker_id text,
+  p_lease_seconds integer
+)
+RETURNS boolean
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+BEGIN
+  UPDATE public.video_processing_queue q
+  SET lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+  WHERE q.id = p_queue_id
+    AND q.lease_owner = p_worker_id
+    AND q.status = 'processing';
+  RETURN FOUND;
+END;
+$$;
+
+
+REVOKE ALL ON FUNCTION public.claim_video_processing_job(text, integer)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_video_processing_job(text, integer)
+  TO service_role;
+
+REVOKE ALL ON FUNCTION public.claim_video_processing_queue(bigint, bigint, text, integer)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_video_processing_queue(bigint, bigint, text, integer)
+  TO service_role;
+
+REVOKE ALL ON FUNCTION public.renew_video_processing_lease(bigint, text, integer)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.renew_video_processing_lease(bigint, text, integer)
+  TO service_role;
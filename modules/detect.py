@@ -1,13 +1,30 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+import os
 import uvicorn
-from app import detect_ai_text  # 导入 AI 检测函数
+import diveye  # 无界面推理核心：不导入 gradio，也不访问网络
+
+# 单次批量请求允许的最大文本数量
+MAX_BATCH_TEXTS = int(os.getenv("MAX_BATCH_TEXTS", "64"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时在线程中加载模型；加载失败时服务仍然启动，检测接口返回 "Model not loaded"
+    try:
+        await asyncio.to_thread(diveye.load_models)
+    except Exception:
+        logging.exception("Failed to load DivEye models")
+    yield
 
 app = FastAPI(
     title="AI Text Detection API",
     description="API for detecting AI-generated text using DivEye model",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 添加 CORS 中间件，允许前端调用
@@ -22,11 +39,29 @@ app.add_middleware(
 class TextInput(BaseModel):
     text: str
 
+class BatchTextInput(BaseModel):
+    texts: list[str]
+
 class DetectionResponse(BaseModel):
     message: str
     ai_probability: float
     confidence: dict
 
+class BatchDetectionResponse(BaseModel):
+    results: list[DetectionResponse]
+
+class LongDetectionResponse(DetectionResponse):
+    windows_total: int
+    windows_scored: int
+    windows: list[dict]
+
+def _to_response(message, ai_prob, confidence):
+    return {
+        "message": message,
+        "ai_probability": float(ai_prob),
+        "confidence": confidence
+    }
+
 @app.get("/")
 def read_root():
     return {"message": "AI Text Detection API is running", "status": "healthy"}
@@ -37,27 +72,47 @@ def detect_api(input: TextInput):
         if not input.text or len(input.text.strip()) == 0:
             raise HTTPException(status_code=400, detail="Text input cannot be empty")
         
-        message, ai_prob, bar_data = detect_ai_text(input.text)
-        
-        # 处理 bar_data DataFrame
-        confidence_dict = {}
-        if bar_data is not None and not bar_data.empty:
-            confidence_dict = {
-                row["Source"]: row["Probability (%)"] 
-                for _, row in bar_data.iterrows()
-            }
-        
-        return {
-            "message": message,
-            "ai_probability": float(ai_prob),
-            "confidence": confidence_dict
-        }
+        message, ai_prob, confidence = diveye.detect(input.text)
+        return _to_response(message, ai_prob, confidence)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
 
+@app.post("/detect/batch", response_model=BatchDetectionResponse)
+def detect_batch_api(input: BatchTextInput):
+    # 整批文本在同一组填充后的前向传播中检测，结果顺序与输入一致
+    if not input.texts:
+        raise HTTPException(status_code=400, detail="Texts cannot be empty")
+    if len(input.texts) > MAX_BATCH_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_TEXTS} texts per batch")
+
+    try:
+        results = diveye.detect_batch(input.texts)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
+    return {"results": [_to_response(*result) for result in results]}
+
+@app.post("/detect/long", response_model=LongDetectionResponse)
+def detect_long_api(input: TextInput):
+    # 长文档按重叠窗口分批检测，聚合结果稳定后提前结束
+    if not input.text or len(input.text.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Text input cannot be empty")
+
+    try:
+        message, ai_prob, confidence, details = diveye.detect_long(input.text)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
+    return {
+        **_to_response(message, ai_prob, confidence),
+        "windows_total": details["windows_total"],
+        "windows_scored": details["windows_scored"],
+        "windows": details["windows"]
+    }
+
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "AI Text Detection"}
+    return {"status": "healthy", "service": "AI Text Detection", "model_loaded": diveye.loaded, "mode": diveye.mode}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,526 @@
+"""
+DivEye 推理核心
+Headless DivEye inference: model loading, feature extraction and classification.
+
+Importing this module loads nothing and never touches gradio or the network; call
+load_models() first. Both the FastAPI server (detect.py) and the Gradio demo (app.py) use it.
+"""
+import copy
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.nn import CrossEntropyLoss
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from features import diveye_feature_matrix, biscope_feature_matrix
+
+MODEL_PATH = Path(__file__).parent / "model.json"
+# auto: GPU pair when CUDA is present, else CPU mode if its classifier file exists
+DIVEYE_MODE = os.getenv("DIVEYE_MODE", "auto").lower()
+# CPU mode scores the 11 DivEye features with a small int8 causal LM and its own classifier,
+# trained on those features (see train_classifier.py); model.json expects all 83.
+CPU_MODEL_NAME = os.getenv("DIVEYE_CPU_MODEL", "HuggingFaceTB/SmolLM2-135M")
+CPU_MODEL_PATH = Path(os.getenv("DIVEYE_CPU_CLASSIFIER", str(Path(__file__).parent / "model_cpu.json")))
+CPU_THREADS = int(os.getenv("DIVEYE_CPU_THREADS", "0"))
+COMPLETION_PROMPT_ONLY = "Complete the following text: "
+# Texts per padded forward pass; texts are sorted by length first so a batch pads little.
+DETECT_BATCH_SIZE = max(1, int(os.getenv("DETECT_BATCH_SIZE", "4")))
+# Finished probabilities kept per text hash, so resubmitted texts skip the models.
+DETECT_CACHE_SIZE = max(0, int(os.getenv("DETECT_CACHE_SIZE", "1024")))
+# Long documents are scored as LONG_WINDOW_WORDS-word windows overlapping by LONG_WINDOW_OVERLAP;
+# a 350-word window stays inside both models' truncation limits. Scripts written without spaces
+# (CJK, kana, Thai, Lao, Myanmar, Khmer) count each character as a word, and any other run longer
+# than LONG_WORD_CHARS is cut, so an unspaced document still splits into windows.
+LONG_WINDOW_WORDS = max(15, int(os.getenv("DIVEYE_LONG_WINDOW_WORDS", "350")))
+LONG_WINDOW_OVERLAP = max(0, min(int(os.getenv("DIVEYE_LONG_WINDOW_OVERLAP", "50")), LONG_WINDOW_WORDS // 2))
+LONG_MIN_WINDOWS = max(1, int(os.getenv("DIVEYE_LONG_MIN_WINDOWS", "4")))
+LONG_STOP_MARGIN = float(os.getenv("DIVEYE_LONG_STOP_MARGIN", "0.05"))
+LONG_WORD_CHARS = 20
+_UNSPACED = "\u0e00-\u0eff\u1000-\u109f\u1780-\u17ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_WINDOW_WORD = re.compile(f"[{_UNSPACED}]|[^\\s{_UNSPACED}]{{1,{LONG_WORD_CHARS}}}")
+# Live-typing sessions whose token prefix state (KV caches, per-token scores) is kept.
+LIVE_SESSIONS = max(1, int(os.getenv("DIVEYE_LIVE_SESSIONS", "16")))
+
+loaded = False
+mode = None
+div_model = div_tokenizer = bi_model = bi_tokenizer = None
+classifier = None
+prompt_cache = None
+prompt_last_logits = None
+prompt_len = 0
+load_lock = threading.Lock()
+classifier_lock = threading.Lock()
+result_cache: "OrderedDict[str, float]" = OrderedDict()
+result_cache_lock = threading.Lock()
+live_sessions: "OrderedDict[str, LiveState]" = OrderedDict()
+live_sessions_lock = threading.Lock()
+
+
+def _load_classifier():
+    global classifier
+    with classifier_lock:
+        if classifier is None:
+            import xgboost as xgb
+            model = xgb.XGBClassifier()
+            model.load_model(CPU_MODEL_PATH if mode == "cpu" else MODEL_PATH)
+            classifier = model
+        return classifier
+
+
+def _text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _empty_result(message):
+    return message, 0.0, {"AI Generated": 0, "Human Written": 0}
+
+
+def _format_result(ai_prob):
+    human_prob = 1 - ai_prob
+
+    if ai_prob > 0.7:
+        message = f"🤖 **Likely AI-generated** (Confidence: {ai_prob:.2%})"
+    elif ai_prob > 0.5:
+        message = f"⚠️ **Possibly AI-generated** (Confidence: {ai_prob:.2%})"
+    else:
+        message = f"✅ **Likely Human-written** (Confidence: {human_prob:.2%})"
+
+    confidence = {"AI Generated": ai_prob * 100, "Human Written": human_prob * 100}
+
+    return message, round(ai_prob, 3), confidence
+
+
+def _validate_text(text):
+    if not loaded:
+        return "❗ Model not loaded. We require a GPU (or DIVEYE_MODE=cpu with a CPU classifier) to run DivEye."
+    if not text or len(text.split()) < 15:
+        return "❗ Please enter some text with at least 15 words."
+    return None
+
+
+# =====================================================================
+# DivEye features
+def _diveye_log_likelihoods(texts):
+    """Right-padded token log likelihoods from one div_model forward pass, plus valid lengths."""
+    encoded = div_tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=1024)
+    input_ids = encoded.input_ids.to(div_model.device)
+    attention_mask = encoded.attention_mask.to(div_model.device)
+    with torch.inference_mode():
+        logits = div_model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+        lengths = (attention_mask.sum(dim=1) - 1).tolist()
+        log_likelihoods = torch.zeros((len(texts), max(input_ids.shape[1] - 1, 1)), device=logits.device)
+        for row, length in enumerate(lengths):
+            # one row at a time: a float32 log_softmax over the whole batch would hold batch x seq x vocab
+            log_probs = torch.log_softmax(logits[row, :length, :].float(), dim=-1)
+            log_likelihoods[row, :length] = log_probs[range(length), input_ids[row, 1:length + 1]]
+    return log_likelihoods.cpu().numpy(), lengths
+# =====================================================================
+
+
+# =====================================================================
+# BiScope features
+def _prepare_prompt_cache():
+    """Run COMPLETION_PROMPT_ONLY through bi_model once; every BiScope pass starts from its cache."""
+    global prompt_cache, prompt_last_logits, prompt_len
+    prompt_ids = bi_tokenizer(COMPLETION_PROMPT_ONLY, return_tensors='pt').input_ids.to(bi_model.device)
+    with torch.inference_mode():
+        outputs = bi_model(input_ids=prompt_ids, use_cache=True)
+    prompt_cache = outputs.past_key_values
+    # predicts the first text token, i.e. the first forward-loss position
+    prompt_last_logits = outputs.logits[0, -1, :]
+    prompt_len = prompt_ids.shape[1]
+
+
+def _biscope_losses(texts):
+    """Right-padded forward/backward cross-entropy from one bi_model forward pass, plus lengths.
+
+    Only the text tokens go through the model; the prompt comes from a copy of the shared cache.
+    """
+    text_ids = [
+        bi_tokenizer(text, return_tensors='pt', max_length=2000, truncation=True).input_ids[0]
+        for text in texts
+    ]
+    lengths = [ids.shape[0] for ids in text_ids]
+    pad_id = bi_tokenizer.pad_token_id if bi_tokenizer.pad_token_id is not None else 0
+
+    input_ids = torch.full((len(texts), max(lengths)), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(texts), prompt_len + max(lengths)), dtype=torch.long)
+    for row, ids in enumerate(text_ids):
+        input_ids[row, :ids.shape[0]] = ids
+        attention_mask[row, :prompt_len + ids.shape[0]] = 1
+    input_ids = input_ids.to(bi_model.device)
+    attention_mask = attention_mask.to(bi_model.device)
+
+    with torch.inference_mode():
+        # the forward pass appends to the cache in place, so each batch works on its own copy
+        past_key_values = copy.deepcopy(prompt_cache)
+        if len(texts) > 1:
+            past_key_values.batch_repeat_interleave(len(texts))
+        logits = bi_model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+            use_cache=True,
+        ).logits
+
+        fce_loss = torch.zeros((len(texts), max(lengths)), device=logits.device)
+        bce_loss = torch.zeros((len(texts), max(lengths)), device=logits.device)
+        for row, length in enumerate(lengths):
+            targets = input_ids[row, :length]
+            fce_logits = torch.cat([prompt_last_logits[None, :], logits[row, :length - 1, :]])
+            fce_loss[row, :length] = CrossEntropyLoss(reduction='none')(fce_logits, targets)
+            bce_loss[row, :length] = CrossEntropyLoss(reduction='none')(logits[row, :length, :], targets)
+    return fce_loss.cpu().numpy(), bce_loss.cpu().numpy(), lengths
+# =====================================================================
+
+
+def _extract_features(texts):
+    log_likelihoods, ll_lengths = _diveye_log_likelihoods(texts)
+    if mode == "cpu":
+        return diveye_feature_matrix(texts, log_likelihoods, ll_lengths)
+    fce_loss, bce_loss, loss_lengths = _biscope_losses(texts)
+    return np.hstack([
+        diveye_feature_matrix(texts, log_likelihoods, ll_lengths),
+        biscope_feature_matrix(fce_loss, bce_loss, loss_lengths),
+    ])
+
+
+def predict_ai_probabilities(texts):
+    """AI probability for each (already validated) text, batching every cache miss."""
+    keys = [_text_key(text) for text in texts]
+    probabilities = {}
+    with result_cache_lock:
+        for key in keys:
+            if key in result_cache:
+                result_cache.move_to_end(key)
+                probabilities[key] = result_cache[key]
+
+    pending = {key: text for key, text in zip(keys, texts) if key not in probabilities}
+    ordered = sorted(pending.items(), key=lambda item: len(item[1]))
+    model = _load_classifier()
+
+    for start in range(0, len(ordered), DETECT_BATCH_SIZE):
+        batch = ordered[start:start + DETECT_BATCH_SIZE]
+        features = _extract_features([text for _, text in batch])
+        batch_probs = model.predict_proba(features)[:, 1]
+        with result_cache_lock:
+            for (key, _), ai_prob in zip(batch, batch_probs):
+                probabilities[key] = ai_prob.item()
+                if DETECT_CACHE_SIZE:
+                    result_cache[key] = ai_prob.item()
+                    result_cache.move_to_end(key)
+            while len(result_cache) > DETECT_CACHE_SIZE:
+                result_cache.popitem(last=False)
+
+    return [probabilities[key] for key in keys]
+
+
+# ===========================================================
+def detect(text):
+    """(message, ai_probability, confidence %) for one text."""
+    text = text.strip()
+    error = _validate_text(text)
+    if error:
+        return _empty_result(error)
+
+    ai_prob = predict_ai_probabilities([text])[0]
+    return _format_result(ai_prob)
+
+
+def detect_batch(texts):
+    """Score many texts with padded forward passes; returns one detect() tuple per text."""
+    texts = [text.strip() for text in texts]
+    errors = [_validate_text(text) for text in texts]
+    valid = [text for text, error in zip(texts, errors) if error is None]
+    probs = iter(predict_ai_probabilities(valid) if valid else [])
+
+    return [
+        _empty_result(error) if error else _format_result(next(probs))
+        for error in errors
+    ]
+
+
+# ===========================================================
+# Long documents: overlapping word windows, scored in batched rounds with early exit
+def _split_windows(text):
+    """(start_word, end_word, window_text) spans of LONG_WINDOW_WORDS words, overlapping."""
+    words = list(_WINDOW_WORD.finditer(text))
+    stride = max(1, LONG_WINDOW_WORDS - LONG_WINDOW_OVERLAP)
+    windows = []
+    for start in range(0, max(len(words) - LONG_WINDOW_OVERLAP, 1), stride):
+        end = min(start + LONG_WINDOW_WORDS, len(words))
+        # fold a short tail into the previous window instead of scoring a stub
+        if windows and end - start < LONG_WINDOW_WORDS // 2:
+            prev_start = windows.pop()[0]
+            start = prev_start
+        windows.append((start, end, text[words[start].start():words[end - 1].end()]))
+    return windows
+
+
+def _spread_order(count):
+    """Window indices ordered so every prefix samples the document evenly: ends, then midpoints."""
+    order = list(dict.fromkeys([0, count - 1]))
+    intervals = deque([(0, count - 1)])
+    while intervals:
+        low, high = intervals.popleft()
+        if high - low < 2:
+            continue
+        middle = (low + high) // 2
+        order.append(middle)
+        intervals.extend([(low, middle), (middle, high)])
+    return order
+
+
+def _window_estimate(probs, total):
+    """Mean window probability and its 95% half-width, with a finite-population correction."""
+    n = len(probs)
+    mean = float(np.mean(probs))
+    if n < 2 or n >= total:
+        return mean, 0.0 if n >= total else 1.0
+    stderr = np.std(probs, ddof=1) / math.sqrt(n) * math.sqrt((total - n) / (total - 1))
+    return mean, 1.96 * float(stderr)
+
+
+def detect_long(text):
+    """detect() over a whole long document.
+
+    Windows are scored DETECT_BATCH_SIZE at a time (one padded pass per model per round).
+    Scoring stops once at least LONG_MIN_WINDOWS are in and the 95% interval of the mean is
+    either narrower than LONG_STOP_MARGIN or clear of the 0.5 decision boundary.
+    Returns the detect() tuple plus a dict describing the windows.
+    """
+    text = text.strip()
+    error = _validate_text(text)
+    if error:
+        message, ai_prob, confidence = _empty_result(error)
+        return message, ai_prob, confidence, {"windows_total": 0, "windows_scored": 0, "windows": []}
+
+    windows = _split_windows(text)
+    order = _spread_order(len(windows))
+    scored = {}
+    for start in range(0, len(order), DETECT_BATCH_SIZE):
+        batch = order[start:start + DETECT_BATCH_SIZE]
+        for index, ai_prob in zip(batch, predict_ai_probabilities([windows[i][2] for i in batch])):
+            scored[index] = ai_prob
+
+        mean, half_width = _window_estimate(list(scored.values()), len(windows))
+        if len(scored) >= min(LONG_MIN_WINDOWS, len(windows)) and (
+            half_width < LONG_STOP_MARGIN or abs(mean - 0.5) > half_width
+        ):
+            break
+
+    message, ai_prob, confidence = _format_result(mean)
+    details = {
+        "windows_total": len(windows),
+        "windows_scored": len(scored),
+        "interval": round(half_width, 3),
+        "windows": [
+            {"index": i, "start_word": windows[i][0], "end_word": windows[i][1], "ai_probability": round(scored[i], 3)}
+            for i in sorted(scored)
+        ],
+    }
+    return message, ai_prob, confidence, details
+
+
+# ===========================================================
+# Live detection: per-session prefix state so an edit re-runs only the changed suffix
+@dataclass
+class LiveState:
+    div_ids: list = field(default_factory=list)
+    div_cache: object = None
+    log_likelihoods: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+    bi_ids: list = field(default_factory=list)
+    bi_cache: object = None
+    fce_loss: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+    bce_loss: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def _trim_cache(cache, keep):
+    """Drop cached positions past ``keep``; a negative crop() removes that many in every version."""
+    remove = cache.get_seq_length() - keep
+    if remove > 0:
+        cache.crop(-remove)
+
+
+def _diveye_incremental(text, state):
+    """DivEye log likelihoods for ``text``, re-running div_model only from the first changed token.
+
+    Log likelihood i scores token i + 1 from logits at position i, so everything before the
+    last unchanged token is reused together with the KV cache up to that position.
+    """
+    ids = div_tokenizer(text, truncation=True, max_length=1024).input_ids
+    start = max(_common_prefix(state.div_ids, ids) - 1, 0)
+    cache = state.div_cache if start > 0 else None
+    if cache is not None:
+        _trim_cache(cache, start)
+
+    input_ids = torch.tensor([ids[start:]], device=div_model.device)
+    with torch.inference_mode():
+        outputs = div_model(input_ids=input_ids, past_key_values=cache, use_cache=True)
+        log_probs = torch.log_softmax(outputs.logits[0, :-1, :].float(), dim=-1)
+        fresh = log_probs[range(input_ids.shape[1] - 1), input_ids[0, 1:]].cpu().numpy()
+
+    state.div_ids = ids
+    state.div_cache = outputs.past_key_values
+    state.log_likelihoods = np.concatenate([state.log_likelihoods[:start], fresh])
+    return state.log_likelihoods
+
+
+def _biscope_incremental(text, state):
+    """BiScope losses for ``text`` on top of the shared prompt cache, reusing the unchanged prefix.
+
+    Backward loss j reads logits at text position j and forward loss j those at j - 1 (the
+    prompt's last logits for j = 0), so both survive up to the last unchanged token.
+    """
+    ids = bi_tokenizer(text, max_length=2000, truncation=True).input_ids
+    start = max(_common_prefix(state.bi_ids, ids) - 1, 0)
+
+    with torch.inference_mode():
+        if start > 0:
+            cache = state.bi_cache
+            _trim_cache(cache, prompt_len + start)
+        else:
+            cache = copy.deepcopy(prompt_cache)
+        input_ids = torch.tensor([ids[start:]], device=bi_model.device)
+        logits = bi_model(input_ids=input_ids, past_key_values=cache, use_cache=True).logits[0]
+
+        targets = input_ids[0]
+        bce = CrossEntropyLoss(reduction='none')(logits, targets).float().cpu().numpy()
+        if start == 0:
+            fce_logits = torch.cat([prompt_last_logits[None, :], logits[:-1, :]])
+            fce = CrossEntropyLoss(reduction='none')(fce_logits, targets).float().cpu().numpy()
+        else:
+            fce = CrossEntropyLoss(reduction='none')(logits[:-1, :], targets[1:]).float().cpu().numpy()
+
+    state.bi_ids = ids
+    state.bi_cache = cache
+    state.bce_loss = np.concatenate([state.bce_loss[:start], bce])
+    state.fce_loss = np.concatenate([state.fce_loss[:start + 1 if start else 0], fce])
+    return state.fce_loss, state.bce_loss
+
+
+def detect_live(text, session_id, should_stop=lambda: False):
+    """detect() for a text being edited in one session; None if ``should_stop`` fires midway.
+
+    Cancellation is checked between model passes; a pass that already finished still updates
+    the session's prefix state, so the next edit benefits from it.
+    """
+    text = text.strip()
+    error = _validate_text(text)
+    if error:
+        return _empty_result(error)
+
+    key = _text_key(text)
+    with result_cache_lock:
+        if key in result_cache:
+            result_cache.move_to_end(key)
+            return _format_result(result_cache[key])
+
+    with live_sessions_lock:
+        state = live_sessions.pop(session_id, None) or LiveState()
+    try:
+        log_likelihoods = _diveye_incremental(text, state)
+        if should_stop():
+            return None
+        features = diveye_feature_matrix([text], log_likelihoods[None, :], [len(log_likelihoods)])
+        if mode == "gpu":
+            fce_loss, bce_loss = _biscope_incremental(text, state)
+            if should_stop():
+                return None
+            features = np.hstack([
+                features,
+                biscope_feature_matrix(fce_loss[None, :], bce_loss[None, :], [len(fce_loss)]),
+            ])
+    finally:
+        with live_sessions_lock:
+            live_sessions[session_id] = state
+            while len(live_sessions) > LIVE_SESSIONS:
+                live_sessions.popitem(last=False)
+
+    ai_prob = _load_classifier().predict_proba(features)[:, 1][0].item()
+    with result_cache_lock:
+        if DETECT_CACHE_SIZE:
+            result_cache[key] = ai_prob
+            while len(result_cache) > DETECT_CACHE_SIZE:
+                result_cache.popitem(last=False)
+    return _format_result(ai_prob)
+
+
+def end_live_session(session_id):
+    """Drop a session's prefix state once its client has gone."""
+    with live_sessions_lock:
+        live_sessions.pop(session_id, None)
+
+
+# ==========================================================
+def load_models():
+    """Resolve DIVEYE_MODE and load its models once; sets ``loaded``. Safe to call repeatedly."""
+    global loaded, mode, div_model, div_tokenizer, bi_model, bi_tokenizer
+    with load_lock:
+        if mode is not None:
+            return loaded
+
+        # Token from environment variable
+        token = os.getenv("HF_TOKEN")
+
+        mode = DIVEYE_MODE
+        if mode == "auto":
+            mode = "gpu" if torch.cuda.is_available() or not CPU_MODEL_PATH.exists() else "cpu"
+
+        if mode == "gpu" and not torch.cuda.is_available():
+            print("[DivEye] CUDA not available. Set DIVEYE_MODE=cpu to run the CPU detector.")
+
+        # Import necessary models and tokenizers
+        if mode == "gpu" and torch.cuda.is_available():
+            model_name_div = "tiiuae/falcon-7b"
+            model_name_bi = "google/gemma-1.1-2b-it"
+
+            div_model = AutoModelForCausalLM.from_pretrained(model_name_div, torch_dtype=torch.float16, device_map="cuda:0", use_auth_token=token)
+            div_tokenizer = AutoTokenizer.from_pretrained(model_name_div, use_fast=False, trust_remote_code=True, use_auth_token=token)
+
+            bi_model = AutoModelForCausalLM.from_pretrained(model_name_bi, torch_dtype=torch.float16, device_map="cuda:1", use_auth_token=token)
+            bi_tokenizer = AutoTokenizer.from_pretrained(model_name_bi, use_fast=False, trust_remote_code=True, use_auth_token=token)
+
+        if mode == "cpu":
+            if CPU_THREADS > 0:
+                torch.set_num_threads(CPU_THREADS)
+            print(f"[DivEye] CPU mode: {CPU_MODEL_NAME} (int8) with {CPU_MODEL_PATH.name}")
+
+            div_model = AutoModelForCausalLM.from_pretrained(CPU_MODEL_NAME, torch_dtype=torch.float32, token=token)
+            div_tokenizer = AutoTokenizer.from_pretrained(CPU_MODEL_NAME, token=token)
+            # Dynamic int8 quantization of every Linear layer; activations stay float32.
+            div_model = torch.ao.quantization.quantize_dynamic(div_model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+        if div_model is None:
+            return loaded
+
+        # Batched passes pad on the right so real tokens keep their unpadded positions.
+        div_tokenizer.padding_side = "right"
+        if div_tokenizer.pad_token is None:
+            div_tokenizer.pad_token = div_tokenizer.eos_token
+
+        div_model.eval()
+        if mode == "gpu":
+            bi_model.eval()
+            _prepare_prompt_cache()
+
+        loaded = True
+        return loaded
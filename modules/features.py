@@ -0,0 +1,198 @@
+"""
+DivEye / BiScope 特征计算
+Feature extraction for DivEye (11 surprisal statistics) and BiScope (72 loss statistics).
+
+The per-text functions are the reference definitions; the ``*_matrix`` functions compute the
+same features for a whole batch from right-padded arrays with masked reductions.
+"""
+import zlib
+
+import numpy as np
+
+DIVEYE_FEATURES = 11
+BISCOPE_FEATURES = 72
+HISTOGRAM_BINS = 20
+BISCOPE_SPLITS = range(1, 10)
+
+
+# =====================================================================
+# Per-text reference
+def compression_ratio(text):
+    return len(zlib.compress(text.encode('utf-8'))) / len(text.encode('utf-8'))
+
+
+def diveye_features(text, token_log_likelihoods):
+    from scipy.stats import skew, kurtosis, entropy
+
+    s = -np.asarray(token_log_likelihoods)
+    mean_s, std_s, var_s, skew_s, kurt_s = np.mean(s), np.std(s), np.var(s), skew(s), kurtosis(s)
+    diff_s = np.diff(s)
+    mean_diff, std_diff = np.mean(diff_s), np.std(diff_s)
+    first_order_diff = np.diff(token_log_likelihoods)
+    second_order_diff = np.diff(first_order_diff)
+    var_2nd = np.var(second_order_diff)
+    entropy_2nd = entropy(np.histogram(second_order_diff, bins=HISTOGRAM_BINS, density=True)[0])
+    autocorr_2nd = np.corrcoef(second_order_diff[:-1], second_order_diff[1:])[0, 1] if len(second_order_diff) > 1 else 0
+    comp_ratio = compression_ratio(text)
+
+    return [mean_s, std_s, var_s, skew_s, kurt_s, mean_diff, std_diff, var_2nd, entropy_2nd, autocorr_2nd, comp_ratio]
+
+
+def biscope_features(fce_loss, bce_loss):
+    features = []
+    for p in BISCOPE_SPLITS:
+        split = len(fce_loss) * p // 10
+        fce_clipped = np.nan_to_num(np.clip(fce_loss[split:], -1e6, 1e6), nan=0.0, posinf=1e6, neginf=-1e6)
+        bce_clipped = np.nan_to_num(np.clip(bce_loss[split:], -1e6, 1e6), nan=0.0, posinf=1e6, neginf=-1e6)
+        features.extend([
+            np.mean(fce_clipped), np.max(fce_clipped), np.min(fce_clipped), np.std(fce_clipped),
+            np.mean(bce_clipped), np.max(bce_clipped), np.min(bce_clipped), np.std(bce_clipped)
+        ])
+    return features
+# =====================================================================
+
+
+# =====================================================================
+# Batched, masked
+def _masked_moments(values, mask, counts):
+    """Mean and 2nd-4th central moments per row over the masked entries (population, like NumPy)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(mask, values, 0.0).sum(axis=1) / counts
+        centered = np.where(mask, values - mean[:, None], 0.0)
+        squared = centered * centered
+        m2 = squared.sum(axis=1) / counts
+        m3 = (squared * centered).sum(axis=1) / counts
+        m4 = (squared * squared).sum(axis=1) / counts
+    return mean, m2, m3, m4
+
+
+def _histogram_entropy(values, mask, counts):
+    """Shannon entropy of np.histogram(row, bins=20) per row.
+
+    The density scaling cancels once ``entropy`` normalises, so only the bin counts matter;
+    the bin assignment follows NumPy's uniform-bin search so boundary values land identically.
+    """
+    rows = values.shape[0]
+    first = np.where(mask, values, np.inf).min(axis=1)
+    last = np.where(mask, values, -np.inf).max(axis=1)
+    empty = counts == 0
+    first = np.where(empty, 0.0, first)
+    last = np.where(empty, 1.0, last)
+    flat = first == last
+    first = np.where(flat, first - 0.5, first)
+    last = np.where(flat, last + 0.5, last)
+
+    edges = np.linspace(first, last, HISTOGRAM_BINS + 1, axis=1)
+    norm = HISTOGRAM_BINS / (last - first)
+    with np.errstate(invalid="ignore"):
+        indices = ((values - first[:, None]) * norm[:, None]).astype(np.intp)
+    indices = np.clip(indices, 0, HISTOGRAM_BINS - 1)
+    row_index = np.arange(rows)[:, None]
+    indices -= values < edges[row_index, indices]
+    indices += (values >= edges[row_index, indices + 1]) & (indices != HISTOGRAM_BINS - 1)
+
+    bin_counts = np.zeros((rows, HISTOGRAM_BINS))
+    np.add.at(bin_counts, (np.broadcast_to(row_index, indices.shape)[mask], indices[mask]), 1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = bin_counts / counts[:, None]
+        terms = np.where(p > 0, p * np.log(np.where(p > 0, p, 1.0)), 0.0)
+    return np.where(empty, np.nan, -terms.sum(axis=1))
+
+
+def _lag_one_autocorrelation(values, counts):
+    """np.corrcoef(x[:-1], x[1:])[0, 1] per row; 0 for rows with fewer than two values."""
+    pairs = np.maximum(counts - 1, 0)
+    mask = np.arange(values.shape[1] - 1)[None, :] < pairs[:, None]
+    a, b = values[:, :-1], values[:, 1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_a = np.where(mask, a, 0.0).sum(axis=1) / pairs
+        mean_b = np.where(mask, b, 0.0).sum(axis=1) / pairs
+        da = np.where(mask, a - mean_a[:, None], 0.0)
+        db = np.where(mask, b - mean_b[:, None], 0.0)
+        corr = (da * db).sum(axis=1) / np.sqrt((da * da).sum(axis=1) * (db * db).sum(axis=1))
+    return np.where(counts > 1, np.clip(corr, -1.0, 1.0), 0.0)
+
+
+def diveye_feature_matrix(texts, log_likelihoods, lengths):
+    """DivEye features for a batch.
+
+    ``log_likelihoods`` is a right-padded ``(batch, max_len)`` array and ``lengths`` holds the
+    number of valid entries per row. Returns a ``(batch, 11)`` float64 array.
+    """
+    ll = np.asarray(log_likelihoods, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if ll.shape[1] < 3:
+        ll = np.pad(ll, ((0, 0), (0, 3 - ll.shape[1])))
+    positions = np.arange(ll.shape[1])[None, :]
+    s = -ll
+
+    mask = positions < lengths[:, None]
+    mean_s, m2, m3, m4 = _masked_moments(s, mask, lengths)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # scipy returns nan where the variance is numerically zero
+        degenerate = m2 <= (np.finfo(np.float64).resolution * mean_s) ** 2
+        skew_s = np.where(degenerate, np.nan, m3 / m2 ** 1.5)
+        kurt_s = np.where(degenerate, np.nan, m4 / m2 ** 2 - 3.0)
+
+    diff_lengths = np.maximum(lengths - 1, 0)
+    diff_s = s[:, 1:] - s[:, :-1]
+    diff_mask = positions[:, :-1] < diff_lengths[:, None]
+    mean_diff, diff_m2, _, _ = _masked_moments(diff_s, diff_mask, diff_lengths)
+
+    second_lengths = np.maximum(lengths - 2, 0)
+    first_order_diff = ll[:, 1:] - ll[:, :-1]
+    second_order_diff = first_order_diff[:, 1:] - first_order_diff[:, :-1]
+    second_mask = positions[:, :-2] < second_lengths[:, None]
+    _, var_2nd, _, _ = _masked_moments(second_order_diff, second_mask, second_lengths)
+    entropy_2nd = _histogram_entropy(second_order_diff, second_mask, second_lengths)
+    autocorr_2nd = _lag_one_autocorrelation(np.where(second_mask, second_order_diff, 0.0), second_lengths)
+
+    comp_ratio = np.array([compression_ratio(text) for text in texts], dtype=np.float64)
+
+    return np.stack([
+        mean_s, np.sqrt(m2), m2, skew_s, kurt_s, mean_diff, np.sqrt(diff_m2),
+        var_2nd, entropy_2nd, autocorr_2nd, comp_ratio,
+    ], axis=1)
+
+
+def biscope_feature_matrix(fce_loss, bce_loss, lengths):
+    """BiScope features for a batch of right-padded ``(batch, max_len)`` loss arrays.
+
+    Every split point reads a suffix of the row, so suffix sums and running max/min over the
+    reversed row give all nine splits at once. Returns a ``(batch, 72)`` float64 array.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    rows = np.arange(len(lengths))[:, None]
+    splits = np.array([[length * p // 10 for p in BISCOPE_SPLITS] for length in lengths], dtype=np.int64)
+    counts = (lengths[:, None] - splits).astype(np.float64)
+
+    columns = []
+    for loss in (fce_loss, bce_loss):
+        loss = np.asarray(loss, dtype=np.float64)
+        loss = np.nan_to_num(np.clip(loss, -1e6, 1e6), nan=0.0, posinf=1e6, neginf=-1e6)
+        mask = np.arange(loss.shape[1])[None, :] < lengths[:, None]
+
+        # suffix_x[:, j] aggregates loss[:, j:length]; one extra column keeps index ``length`` valid
+        padded = np.concatenate([np.where(mask, loss, 0.0), np.zeros((len(lengths), 1))], axis=1)
+        suffix_sum = np.cumsum(padded[:, ::-1], axis=1)[:, ::-1]
+        high = np.concatenate([np.where(mask, loss, -np.inf), np.full((len(lengths), 1), -np.inf)], axis=1)
+        low = np.concatenate([np.where(mask, loss, np.inf), np.full((len(lengths), 1), np.inf)], axis=1)
+        suffix_max = np.maximum.accumulate(high[:, ::-1], axis=1)[:, ::-1]
+        suffix_min = np.minimum.accumulate(low[:, ::-1], axis=1)[:, ::-1]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = suffix_sum[rows, splits] / counts
+            # Two-pass variance like np.var; E[x^2] - mean^2 cancels for large losses.
+            in_suffix = mask[:, None, :] & (
+                np.arange(loss.shape[1])[None, None, :] >= splits[:, :, None]
+            )
+            centered = np.where(in_suffix, loss[:, None, :] - mean[:, :, None], 0.0)
+            var = (centered * centered).sum(axis=2) / counts
+        columns.append((mean, suffix_max[rows, splits], suffix_min[rows, splits], np.sqrt(var)))
+
+    (fce_mean, fce_max, fce_min, fce_std), (bce_mean, bce_max, bce_min, bce_std) = columns
+    # (batch, 9 splits, 8 statistics) flattened in the same order as biscope_features
+    return np.stack(
+        [fce_mean, fce_max, fce_min, fce_std, bce_mean, bce_max, bce_min, bce_std], axis=2
+    ).reshape(len(lengths), BISCOPE_FEATURES)
+# =====================================================================
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+长文档分窗测试
+Window test: long documents split into bounded windows, including scripts written without spaces.
+
+Runs without models or a GPU:  python test_windows.py  (or: pytest test_windows.py)
+"""
+import diveye
+
+# A short tail is folded into the last window, so that one may run up to half a window over.
+MAX_WINDOW = diveye.LONG_WINDOW_WORDS * 3 // 2
+
+
+def _window_sizes(text):
+    return [len(diveye._WINDOW_WORD.findall(window)) for _, _, window in diveye._split_windows(text)]
+
+
+def test_spaced_text_windows():
+    text = " ".join(f"word{i}" for i in range(1000))
+    sizes = _window_sizes(text)
+
+    assert len(sizes) > 1
+    assert max(sizes) <= MAX_WINDOW
+
+
+def test_unspaced_text_windows():
+    # One long run of CJK text has no whitespace at all
+    text = "机器生成的文本检测需要把长文档切成较短的窗口。" * 200
+    windows = diveye._split_windows(text)
+
+    assert len(windows) > 1
+    assert max(len(window) for _, _, window in windows) <= MAX_WINDOW
+    assert windows[0][2].startswith("机器") and windows[-1][2].endswith("窗口。")
+
+
+def test_long_runs_are_cut():
+    text = "x" * (diveye.LONG_WORD_CHARS * 1000)
+    sizes = _window_sizes(text)
+
+    assert len(sizes) > 1
+    assert max(sizes) <= MAX_WINDOW
+
+
+if __name__ == "__main__":
+    print("🧪 Testing long-document windows...")
+    test_spaced_text_windows()
+    test_unspaced_text_windows()
+    test_long_runs_are_cut()
+    print("✅ Windows are bounded for spaced and unspaced text")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+DivEye 分类器训练脚本
+Train the XGBoost classifier on features from the configured detector mode.
+
+    python train_classifier.py labelled.jsonl --mode cpu --output model_cpu.json
+
+Each input line is {"text": "...", "label": 0 | 1} with 1 = AI-generated.
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", type=Path, help="JSONL file with text and label fields")
+    parser.add_argument("--mode", choices=["cpu", "gpu"], default="cpu", help="feature extractor to train for")
+    parser.add_argument("--output", type=Path, default=None, help="defaults to model_cpu.json / model.json")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # diveye reads DIVEYE_MODE at import time
+    os.environ["DIVEYE_MODE"] = args.mode
+    sys.path.insert(0, str(Path(__file__).parent))
+    import numpy as np
+    import xgboost as xgb
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    from sklearn.model_selection import train_test_split
+    from tqdm import tqdm
+    import diveye
+
+    if not diveye.load_models():
+        print(f"❌ {args.mode} detector could not be loaded")
+        return 1
+
+    rows = [json.loads(line) for line in args.data.read_text(encoding="utf-8").splitlines() if line.strip()]
+    texts = [row["text"].strip() for row in rows]
+    labels = np.array([int(row["label"]) for row in rows])
+
+    features = []
+    for start in tqdm(range(0, len(texts), diveye.DETECT_BATCH_SIZE), desc="features"):
+        features.append(diveye._extract_features(texts[start:start + diveye.DETECT_BATCH_SIZE]))
+    features = np.vstack(features)
+
+    x_train, x_test, y_train, y_test = train_test_split(
+        features, labels, test_size=args.test_size, random_state=42, stratify=labels
+    )
+    model = xgb.XGBClassifier(n_estimators=400, max_depth=6, learning_rate=0.05, subsample=0.9)
+    model.fit(x_train, y_train)
+
+    probs = model.predict_proba(x_test)[:, 1]
+    print(f"📊 {features.shape[1]} features, {len(y_train)} train / {len(y_test)} test")
+    print(f"   Accuracy: {accuracy_score(y_test, probs > 0.5):.4f}  AUROC: {roc_auc_score(y_test, probs):.4f}")
+
+    output = args.output or (diveye.CPU_MODEL_PATH if args.mode == "cpu" else diveye.MODEL_PATH)
+    model.save_model(output)
+    print(f"✅ Saved classifier to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
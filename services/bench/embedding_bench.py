@@ -0,0 +1,295 @@
+"""Load test for the E5 and BGE-M3 embedding servers.
+
+Replays a mix of query-length and chunk-length texts (English and CJK) against
+``/embed`` or ``/embed/batch`` at each requested concurrency and batch size,
+and reports throughput, p50/p95/p99 latency and server CPU utilisation for
+every server configuration in the matrix.
+
+Targets:
+
+- ``asgi``: the app runs in a child process and is called through
+  ``httpx.ASGITransport`` (no network stack)
+- ``launch``: the app is started with uvicorn on a local port per config
+- ``url``: an already running server; the matrix is ignored
+
+    python services/bench/embedding_bench.py --service e5 --model intfloat/e5-small \\
+        --target launch --concurrency 1 4 16 --batch-sizes 1 16 \\
+        --matrix MAX_LENGTH=256,512 --matrix OMP_NUM_THREADS=2,4
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from servers import EMBEDDING_SERVICES, embedding_server
+
+
+EN_WORDS = (
+    "lecture gradient descent model data learning rate matrix vector student "
+    "course example question answer theory proof function derivative integral "
+    "network layer training loss optimisation review summary chapter section "
+    "history economics market policy experiment result analysis method sample "
+    "energy force velocity chemistry reaction molecule protein cell biology"
+).split()
+CJK_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动"
+    "同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自"
+    "二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日"
+)
+
+
+def make_texts(count: int, query_fraction: float, cjk_fraction: float, seed: int) -> list[tuple[str, str]]:
+    """Return (task, text) pairs; queries are short, passages chunk-length."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        is_query = rng.random() < query_fraction
+        if rng.random() < cjk_fraction:
+            length = rng.randint(8, 24) if is_query else rng.randint(300, 700)
+            text = "".join(rng.choice(CJK_CHARS) for _ in range(length))
+        else:
+            length = rng.randint(4, 16) if is_query else rng.randint(150, 350)
+            text = " ".join(rng.choice(EN_WORDS) for _ in range(length))
+        texts.append(("query" if is_query else "passage", text))
+    return texts
+
+
+def _request_body(batch: list[tuple[str, str]]) -> tuple[str, dict]:
+    task = batch[0][0] if len(batch) == 1 else "passage"
+    if len(batch) == 1:
+        return "/embed", {"input": batch[0][1], "task": task}
+    return "/embed/batch", {"inputs": [text for _, text in batch], "task": task}
+
+
+def _percentile(values: list[float], percentile: int) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percentile - 1]
+
+
+def _process_cpu_seconds(pid: int | None) -> float | None:
+    if pid is None:
+        return None
+    if pid == os.getpid():
+        return time.process_time()
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    texts: list[tuple[str, str]],
+    concurrency: int,
+    batch_size: int,
+    requests: int,
+    server_pid: int | None,
+) -> dict:
+    batches = [
+        [texts[(index * batch_size + offset) % len(texts)] for offset in range(batch_size)]
+        for index in range(requests)
+    ]
+    queue: asyncio.Queue = asyncio.Queue()
+    for batch in batches:
+        queue.put_nowait(batch)
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while not queue.empty():
+            path, body = _request_body(queue.get_nowait())
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors += 1
+
+    cpu_before = _process_cpu_seconds(server_pid)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    cpu_after = _process_cpu_seconds(server_pid)
+    completed = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(completed / wall, 2),
+        "texts_per_second": round(completed * batch_size / wall, 2),
+        "p50_ms": _ms(_percentile(latencies, 50)),
+        "p95_ms": _ms(_percentile(latencies, 95)),
+        "p99_ms": _ms(_percentile(latencies, 99)),
+        "cpu_cores": (
+            round((cpu_after - cpu_before) / wall, 2)
+            if cpu_before is not None and cpu_after is not None
+            else None
+        ),
+    }
+
+
+def _ms(value: float | None) -> float | None:
+    return round(value * 1000, 1) if value is not None else None
+
+
+async def run_grid(client: httpx.AsyncClient, args, server_pid: int | None) -> list[dict]:
+    texts = make_texts(args.texts, args.query_fraction, args.cjk_fraction, args.seed)
+    # One warm-up request so lazy kernel initialisation is not measured.
+    await run_load(client, texts, 1, 1, 1, None)
+    results = []
+    for concurrency, batch_size in itertools.product(args.concurrency, args.batch_sizes):
+        results.append(
+            await run_load(client, texts, concurrency, batch_size, args.requests, server_pid)
+        )
+    return results
+
+
+def _headers(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _asgi_worker(args, token: str) -> list[dict]:
+    spec = importlib.util.spec_from_file_location(
+        "embedding_app",
+        EMBEDDING_SERVICES[args.service] / "app.py",
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    async with module.app.router.lifespan_context(module.app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=module.app),
+            base_url="http://bench",
+            headers=_headers(token),
+            timeout=args.timeout,
+        ) as client:
+            # Models load in the background after startup; wait for readiness.
+            while (await client.get("/readyz")).status_code != 200:
+                await asyncio.sleep(0.5)
+            return await run_grid(client, args, os.getpid())
+
+
+def run_asgi(args, config: dict[str, str], token: str) -> list[dict]:
+    # Server configuration is read at import time, so each config gets a
+    # fresh interpreter.
+    env = {
+        **os.environ,
+        "MODEL_PATH": args.model,
+        "DEVICE": "cpu",
+        "EMBEDDING_API_TOKEN": token,
+        **config,
+    }
+    completed = subprocess.run(
+        [sys.executable, __file__, "--asgi-worker", *sys.argv[1:]],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+async def _run_http(args, base_url: str, token: str, pid: int | None) -> list[dict]:
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        headers=_headers(token),
+        timeout=args.timeout,
+    ) as client:
+        return await run_grid(client, args, pid)
+
+
+def run_launch(args, config: dict[str, str], token: str) -> list[dict]:
+    with embedding_server(args.service, args.model, token, config) as server:
+        return asyncio.run(_run_http(args, server.url, token, server.pid))
+
+
+def parse_matrix(entries: list[str]) -> list[dict[str, str]]:
+    axes = []
+    for entry in entries:
+        key, _, values = entry.partition("=")
+        if not key or not values:
+            raise SystemExit(f"invalid --matrix entry {entry!r}; expected KEY=v1,v2")
+        axes.append([(key, value) for value in values.split(",")])
+    return [dict(combination) for combination in itertools.product(*axes)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--service", choices=sorted(EMBEDDING_SERVICES), default="e5")
+    parser.add_argument("--target", choices=["asgi", "launch", "url"], default="asgi")
+    parser.add_argument("--model", help="MODEL_PATH for asgi/launch targets")
+    parser.add_argument("--url", help="base URL for the url target")
+    parser.add_argument("--token", default=os.getenv("EMBEDDING_API_TOKEN"))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--query-fraction", type=float, default=0.5)
+    parser.add_argument("--cjk-fraction", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument(
+        "--matrix",
+        action="append",
+        default=[],
+        help="server env axis, e.g. MAX_LENGTH=256,512 (repeatable)",
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--asgi-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.asgi_worker:
+        print(json.dumps(asyncio.run(_asgi_worker(args, os.environ["EMBEDDING_API_TOKEN"]))))
+        return
+
+    if args.target == "url":
+        if not args.url or not args.token:
+            raise SystemExit("--url and --token (or EMBEDDING_API_TOKEN) are required")
+        configs = [{}]
+    else:
+        if not args.model:
+            raise SystemExit("--model is required for asgi and launch targets")
+        configs = parse_matrix(args.matrix)
+
+    report = []
+    for config in configs:
+        token = args.token or uuid.uuid4().hex
+        if args.target == "url":
+            results = asyncio.run(_run_http(args, args.url, token, None))
+        elif args.target == "launch":
+            results = run_launch(args, config, token)
+        else:
+            results = run_asgi(args, config, token)
+        report.append(
+            {"service": args.service, "target": args.target, "config": config, "results": results}
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
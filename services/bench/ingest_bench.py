@@ -0,0 +1,347 @@
+"""End-to-end ingestion benchmark for the Whisper server.
+
+Generates synthetic media with ffmpeg, runs ``_run_job`` from
+``services/whisper-server/app.py`` in-process against local stand-ins for
+Supabase and MEGA, and embeds through locally launched E5/BGE servers. Prints
+stage timings, real-time factor, peak RSS and temp-disk high-water marks as
+JSON.
+
+    python services/bench/ingest_bench.py --durations 60 600 --model-size tiny
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from prometheus_client import REGISTRY
+
+from servers import SERVICES_DIR, embedding_server, free_port
+
+
+STAGES = (
+    "download",
+    "faststart",
+    "faststart_upload",
+    "validate",
+    "wav_conversion",
+    "asr",
+    "semantic_chunking",
+    "embedding_e5",
+    "embedding_bge",
+    "persistence",
+)
+SPEECH_TEXT = (
+    "Welcome to this lecture. Today we review gradient descent, learning rates "
+    "and why normalisation helps optimisation converge on real data sets."
+)
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """Chainable stand-in for the postgrest query builder used by the server."""
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.is_single = False
+
+    def select(self, *_):
+        self.action = "select"
+        return self
+
+    def update(self, payload):
+        self.action = "update"
+        self.payload = payload
+        return self
+
+    def insert(self, payload):
+        self.action = "insert"
+        self.payload = payload
+        return self
+
+    def eq(self, *_):
+        return self
+
+    in_ = limit = contains = eq
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    def execute(self) -> FakeResult:
+        self.client.calls.append((self.table, self.action))
+        if self.action == "select":
+            return FakeResult({} if self.is_single else [])
+        return FakeResult([self.payload])
+
+
+class FakeRpc:
+    def __init__(self, result: FakeResult):
+        self.result = result
+
+    def execute(self) -> FakeResult:
+        return self.result
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.calls: list[tuple[str, str]] = []
+        self.rows: list[dict] = []
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> FakeRpc:
+        self.calls.append(("rpc", name))
+        if name == "renew_video_processing_lease":
+            return FakeRpc(FakeResult(True))
+        self.rows = list(params.get("p_rows") or [])
+        return FakeRpc(FakeResult(len(self.rows)))
+
+
+def generate_media(output: Path, duration: float, kind: str) -> None:
+    if kind == "speech":
+        audio = (
+            f"flite=text='{SPEECH_TEXT}':voice=slt,"
+            "aloop=loop=-1:size=2000000000"
+        )
+    else:
+        audio = "sine=frequency=440:sample_rate=44100"
+    # A plain MP4 mux writes moov after mdat, so the Fast Start stage runs too.
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-y",
+            "-v",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            audio,
+            "-f",
+            "lavfi",
+            "-i",
+            "color=c=black:size=320x240:rate=5",
+            "-t",
+            str(duration),
+            "-c:v",
+            "mpeg4",
+            "-c:a",
+            "aac",
+            str(output),
+        ],
+        check=True,
+    )
+
+
+def load_whisper_app():
+    spec = importlib.util.spec_from_file_location(
+        "whisper_app",
+        SERVICES_DIR / "whisper-server" / "app.py",
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def install_fakes(whisper_app, media: dict[str, Path]) -> FakeSupabase:
+    fake_supabase = FakeSupabase()
+
+    def fake_download(url: str, cancel: threading.Event | None = None) -> Path:
+        work_dir = Path(tempfile.mkdtemp(prefix="studify-mega-", dir=whisper_app.TEMP_DIR))
+        target = work_dir / media[url].name
+        shutil.copyfile(media[url], target)
+        return target
+
+    def fake_upload(
+        path: Path, attachment_id: int, cancel: threading.Event | None = None
+    ) -> str:
+        upload_path = path.with_name(f"studify-video-{attachment_id}-faststart.mp4")
+        shutil.copyfile(path, upload_path)
+        upload_path.unlink()
+        return f"https://mega.nz/file/bench-{attachment_id}"
+
+    whisper_app.supabase = fake_supabase
+    whisper_app._download_mega = fake_download
+    whisper_app._upload_optimized_to_mega = fake_upload
+    return fake_supabase
+
+
+def stage_sums() -> dict[str, float]:
+    return {
+        stage: REGISTRY.get_sample_value(
+            "whisper_job_stage_seconds_sum", {"stage": stage}
+        )
+        or 0.0
+        for stage in STAGES
+    }
+
+
+class TempDiskSampler:
+    def __init__(self, whisper_app, interval: float = 0.1):
+        self.whisper_app = whisper_app
+        self.interval = interval
+        self.high_water = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.high_water = max(self.high_water, self.whisper_app._temp_disk_usage())
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stopped.set()
+        self.thread.join()
+
+
+async def run_once(whisper_app, fake_supabase, url: str, duration: float, args) -> dict:
+    job_id = str(uuid.uuid4())
+    with whisper_app.jobs_lock:
+        whisper_app.jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+        }
+    before = stage_sums()
+    started = time.monotonic()
+    with TempDiskSampler(whisper_app) as sampler:
+        await whisper_app._run_job(
+            job_id=job_id,
+            source=None,
+            source_url=url,
+            task="transcribe",
+            beam_size=args.beam_size,
+            queue_id=1,
+            attachment_id=1,
+            profile=args.profile,
+        )
+    wall = time.monotonic() - started
+    after = stage_sums()
+    job = whisper_app.jobs[job_id]
+    stages = {stage: round(after[stage] - before[stage], 3) for stage in STAGES}
+    return {
+        "duration_seconds": duration,
+        "kind": args.kind,
+        "status": job["status"],
+        "error": job.get("error"),
+        "wall_seconds": round(wall, 3),
+        "stages": stages,
+        "rtf": round(duration / stages["asr"], 3) if stages["asr"] else None,
+        "segments_indexed": len(fake_supabase.rows),
+        "temp_disk_high_water_bytes": sampler.high_water,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "peak_child_rss_bytes": (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        ),
+    }
+
+
+async def run_benchmark(args, media: dict[str, Path], durations: dict[str, float]) -> list[dict]:
+    whisper_app = load_whisper_app()
+    from faster_whisper import WhisperModel
+
+    whisper_app.model = WhisperModel(
+        args.model_size,
+        device="cpu",
+        compute_type=args.compute_type,
+    )
+    whisper_app.semaphore = asyncio.Semaphore(1)
+    whisper_app._load_chunk_tokenizer()
+    fake_supabase = install_fakes(whisper_app, media)
+    runs = []
+    for url in media:
+        runs.append(await run_once(whisper_app, fake_supabase, url, durations[url], args))
+    return runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[60.0])
+    parser.add_argument("--kind", choices=["tone", "speech"], default="speech")
+    parser.add_argument("--model-size", default="tiny")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--beam-size", type=int, default=5)
+    parser.add_argument("--profile", choices=["fast", "accurate"], default=None)
+    parser.add_argument("--e5-model", default="intfloat/e5-small")
+    parser.add_argument(
+        "--bge-model",
+        default=None,
+        help="1024-d model for the BGE server; omitted means E5-only rows",
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    token = uuid.uuid4().hex
+    work_dir = Path(tempfile.mkdtemp(prefix="studify-bench-"))
+    try:
+        media: dict[str, Path] = {}
+        durations: dict[str, float] = {}
+        for duration in args.durations:
+            path = work_dir / f"input-{int(duration)}s.mp4"
+            generate_media(path, duration, args.kind)
+            url = f"https://mega.nz/file/bench-{int(duration)}"
+            media[url] = path
+            durations[url] = duration
+
+        with ExitStack() as stack:
+            e5_url = stack.enter_context(embedding_server("e5", args.e5_model, token)).url
+            bge_url = (
+                stack.enter_context(embedding_server("bge", args.bge_model, token)).url
+                if args.bge_model
+                else f"http://127.0.0.1:{free_port()}"
+            )
+            temp_dir = work_dir / "tmp"
+            temp_dir.mkdir()
+            # The server reads its configuration at import time.
+            os.environ.update(
+                {
+                    "WHISPER_MODEL_SIZE": args.model_size,
+                    "WHISPER_COMPUTE_TYPE": args.compute_type,
+                    "WHISPER_TEMP_DIR": str(temp_dir),
+                    "E5_HG_EMBEDDING_SERVER_API_URL": e5_url,
+                    "BGE_HG_EMBEDDING_SERVER_API_URL": bge_url,
+                    "EMBEDDING_API_TOKEN": token,
+                }
+            )
+            runs = asyncio.run(run_benchmark(args, media, durations))
+
+        report = {
+            "config": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+            "runs": runs,
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            Path(args.output).write_text(output + "\n")
+        else:
+            print(output)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Check the video_processing_queue lease RPCs against a local Postgres.
+
+Applies ``db/migrations/20261019_video_processing_queue_leases.sql`` to a
+scratch database, creating minimal stand-ins for the tables and Supabase roles
+it references when they are missing. Then it checks that:
+
+- concurrent claimers never receive the same row
+- a heartbeat only extends the owner's lease
+- expired leases are re-queued, with their step, until ``max_retries``
+- a pushed row is refused while any lease on it is live, even the caller's
+
+Seeded rows are deleted afterwards. Claims take any pending row, so use a
+scratch database, not one with real queue rows.
+
+    python services/bench/queue_lease_check.py --dsn postgresql://localhost/studify_scratch
+"""
+
+import argparse
+import sys
+import threading
+from pathlib import Path
+
+import psycopg
+
+
+MIGRATION = (
+    Path(__file__).resolve().parents[2]
+    / "db"
+    / "migrations"
+    / "20261019_video_processing_queue_leases.sql"
+)
+SEED_TITLE = "queue-lease-check"
+STAND_INS = """
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'anon') THEN
+    CREATE ROLE anon NOLOGIN;
+  END IF;
+  IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'authenticated') THEN
+    CREATE ROLE authenticated NOLOGIN;
+  END IF;
+  IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'service_role') THEN
+    CREATE ROLE service_role NOLOGIN;
+  END IF;
+END
+$$;
+CREATE SCHEMA IF NOT EXISTS extensions;
+CREATE TABLE IF NOT EXISTS public.course_attachments (
+  id bigserial PRIMARY KEY,
+  owner_id bigint NOT NULL DEFAULT 0,
+  title text NOT NULL,
+  url text NOT NULL,
+  is_deleted boolean NOT NULL DEFAULT false
+);
+CREATE TABLE IF NOT EXISTS public.video_processing_queue (
+  id bigserial PRIMARY KEY,
+  attachment_id bigint NOT NULL,
+  user_id uuid NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+  current_step varchar(50) NOT NULL,
+  status varchar(20) NOT NULL DEFAULT 'pending',
+  retry_count integer DEFAULT 0,
+  max_retries integer DEFAULT 3,
+  error_message text,
+  last_error_at timestamptz,
+  processing_metadata jsonb DEFAULT '{}'::jsonb,
+  progress_percentage integer DEFAULT 0,
+  started_at timestamptz,
+  created_at timestamptz DEFAULT now(),
+  updated_at timestamptz DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS public.video_processing_steps (
+  id bigserial PRIMARY KEY,
+  queue_id bigint NOT NULL,
+  step_name varchar(50) NOT NULL,
+  status varchar(20) NOT NULL DEFAULT 'pending',
+  started_at timestamptz,
+  completed_at timestamptz,
+  error_message text,
+  updated_at timestamptz DEFAULT now()
+);
+"""
+
+
+def seed(conn: psycopg.Connection, count: int) -> list[tuple[int, int]]:
+    rows = []
+    for index in range(count + 1):
+        # The last attachment is not on MEGA, so pull mode must leave it alone.
+        url = (
+            f"https://mega.nz/file/check-{index}"
+            if index < count
+            else "https://example.com/video.mp4"
+        )
+        attachment_id = conn.execute(
+            "INSERT INTO public.course_attachments (owner_id, title, url) "
+            "VALUES (0, %s, %s) RETURNING id",
+            (SEED_TITLE, url),
+        ).fetchone()[0]
+        queue_id = conn.execute(
+            "INSERT INTO public.video_processing_queue "
+            "(attachment_id, user_id, current_step, status) "
+            "VALUES (%s, '00000000-0000-0000-0000-000000000000', 'transcribe', 'pending') "
+            "RETURNING id",
+            (attachment_id,),
+        ).fetchone()[0]
+        conn.execute(
+            "INSERT INTO public.video_processing_steps (queue_id, step_name) "
+            "VALUES (%s, 'transcribe')",
+            (queue_id,),
+        )
+        rows.append((queue_id, attachment_id))
+    return rows
+
+
+def cleanup(conn: psycopg.Connection) -> None:
+    conn.execute(
+        "DELETE FROM public.video_processing_steps WHERE queue_id IN ("
+        " SELECT q.id FROM public.video_processing_queue q"
+        " JOIN public.course_attachments a ON a.id = q.attachment_id"
+        " WHERE a.title = %s)",
+        (SEED_TITLE,),
+    )
+    conn.execute(
+        "DELETE FROM public.video_processing_queue WHERE attachment_id IN ("
+        " SELECT id FROM public.course_attachments WHERE title = %s)",
+        (SEED_TITLE,),
+    )
+    conn.execute("DELETE FROM public.course_attachments WHERE title = %s", (SEED_TITLE,))
+
+
+def claim(conn: psycopg.Connection, worker: str, lease: int = 60):
+    return conn.execute(
+        "SELECT * FROM public.claim_video_processing_job(%s, %s)", (worker, lease)
+    ).fetchone()
+
+
+def step_status(conn: psycopg.Connection, queue_id: int) -> str:
+    return conn.execute(
+        "SELECT status FROM public.video_processing_steps "
+        "WHERE queue_id = %s AND step_name = 'transcribe'",
+        (queue_id,),
+    ).fetchone()[0]
+
+
+def expire(conn: psycopg.Connection, queue_id: int) -> None:
+    conn.execute(
+        "UPDATE public.video_processing_queue "
+        "SET lease_expires_at = now() - interval '1 second' WHERE id = %s",
+        (queue_id,),
+    )
+
+
+def check_concurrent_claims(dsn: str, rows: list[tuple[int, int]], workers: int) -> None:
+    claimed: dict[str, list[int]] = {}
+
+    def run(worker: str) -> None:
+        mine = claimed.setdefault(worker, [])
+        with psycopg.connect(dsn, autocommit=True) as conn:
+            while (row := claim(conn, worker)) is not None:
+                mine.append(row[0])
+
+    threads = [
+        threading.Thread(target=run, args=(f"check-{index}",)) for index in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_claims = [queue_id for ids in claimed.values() for queue_id in ids]
+    expected = sorted(queue_id for queue_id, _ in rows[:-1])
+    assert len(all_claims) == len(set(all_claims)), "a row was claimed twice"
+    assert sorted(all_claims) == expected, "claims do not cover exactly the MEGA rows"
+    busy = sum(1 for ids in claimed.values() if ids)
+    print(f"✅ {len(all_claims)} rows claimed once each by {busy}/{workers} workers")
+
+
+def check_leases(conn: psycopg.Connection, rows: list[tuple[int, int]]) -> None:
+    queue_id, attachment_id = rows[0]
+    owner = conn.execute(
+        "SELECT lease_owner FROM public.video_processing_queue WHERE id = %s", (queue_id,)
+    ).fetchone()[0]
+
+    renew = "SELECT public.renew_video_processing_lease(%s, %s, 60)"
+    assert conn.execute(renew, (queue_id, owner)).fetchone()[0]
+    assert not conn.execute(renew, (queue_id, "intruder")).fetchone()[0]
+    print("✅ heartbeat renews only the owner's lease")
+
+    push = "SELECT public.claim_video_processing_queue(%s, %s, %s, 60)"
+    assert not conn.execute(push, (queue_id, attachment_id, "pusher")).fetchone()[0]
+    assert not conn.execute(push, (queue_id, attachment_id, owner)).fetchone()[0]
+    try:
+        conn.execute(push, (queue_id, rows[1][1], "pusher"))
+    except psycopg.errors.RaiseException:
+        pass
+    else:
+        raise AssertionError("mismatched attachment was accepted")
+    print("✅ pushed row is refused while a lease is live, even by its owner")
+
+    # Each expiry re-queues the row and counts a retry; the third one fails it.
+    for retry in (1, 2):
+        expire(conn, queue_id)
+        row = claim(conn, "check-retry")
+        assert row is not None and row[0] == queue_id and row[3] == retry, row
+        assert step_status(conn, queue_id) == "processing"
+    assert not conn.execute(renew, (queue_id, owner)).fetchone()[0]
+    expire(conn, queue_id)
+    assert claim(conn, "check-retry") is None
+    status, retries, lease_owner = conn.execute(
+        "SELECT status, retry_count, lease_owner FROM public.video_processing_queue WHERE id = %s",
+        (queue_id,),
+    ).fetchone()
+    assert (status, retries, lease_owner) == ("failed", 3, None), (status, retries, lease_owner)
+    assert step_status(conn, queue_id) == "failed"
+    print("✅ expired leases re-queue twice, then fail at max_retries")
+
+    expire(conn, rows[1][0])
+    expire(conn, rows[2][0])
+    # One claim re-queues both expired rows but only takes the older one.
+    assert claim(conn, "check-retry")[0] == rows[1][0]
+    assert step_status(conn, rows[2][0]) == "pending"
+    print("✅ re-queued rows put their transcribe step back to pending")
+
+    expire(conn, rows[1][0])
+    assert conn.execute(push, (rows[1][0], rows[1][1], "pusher")).fetchone()[0]
+    print("✅ pushed row is claimable once the previous lease expired")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--dsn", required=True, help="scratch database connection string")
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(STAND_INS)
+        conn.execute(MIGRATION.read_text(encoding="utf-8"))
+        cleanup(conn)
+        rows = seed(conn, args.rows)
+        try:
+            check_concurrent_claims(args.dsn, rows, args.workers)
+            check_leases(conn, rows)
+        finally:
+            cleanup(conn)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
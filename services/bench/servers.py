@@ -0,0 +1,87 @@
+"""Launch the Studify embedding servers as local subprocesses for benchmarks."""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+
+
+SERVICES_DIR = Path(__file__).resolve().parent.parent
+EMBEDDING_SERVICES = {
+    "e5": SERVICES_DIR / "embedding-e5-server",
+    "bge": SERVICES_DIR / "embedding-bge-m3-server",
+}
+
+
+@dataclass
+class LaunchedServer:
+    url: str
+    pid: int
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@contextmanager
+def embedding_server(
+    name: str,
+    model_path: str,
+    token: str,
+    extra_env: dict[str, str] | None = None,
+    startup_timeout: float = 600,
+):
+    """Run one embedding server on a free port and yield its URL and pid."""
+    port = free_port()
+    env = {
+        **os.environ,
+        "MODEL_PATH": model_path,
+        "DEVICE": "cpu",
+        "EMBEDDING_API_TOKEN": token,
+        **(extra_env or {}),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=EMBEDDING_SERVICES[name],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} server exited with {process.returncode}")
+            try:
+                if httpx.get(f"{base_url}/healthz", timeout=2).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} server did not become healthy")
+            time.sleep(0.5)
+        yield LaunchedServer(base_url, process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
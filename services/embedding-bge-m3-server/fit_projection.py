@@ -0,0 +1,72 @@
+"""Fit the reduced-dimension PCA artifact served by the BGE-M3 server.
+
+Input is a ``.npy`` matrix of normalized 1024-d BGE-M3 vectors sampled from the
+corpus (for example an export of ``video_embeddings.embedding_bge_m3``). The
+output ``.npz`` is loaded at startup through ``PROJECTION_PATH``.
+
+    python fit_projection.py corpus.npy projection-128.npz --dimension 128
+"""
+
+import argparse
+import hashlib
+
+import numpy as np
+
+
+EXPECTED_DIMENSION = 1024
+
+
+def fit_projection(
+    vectors: np.ndarray,
+    dimension: int,
+    clip_percentile: float,
+) -> dict[str, np.ndarray]:
+    if vectors.ndim != 2 or vectors.shape[1] != EXPECTED_DIMENSION:
+        raise ValueError(f"expected an (n, {EXPECTED_DIMENSION}) matrix, got {vectors.shape}")
+    if not 0 < dimension < EXPECTED_DIMENSION:
+        raise ValueError(f"dimension must be between 1 and {EXPECTED_DIMENSION - 1}")
+    if vectors.shape[0] < dimension:
+        raise ValueError("need at least as many sample vectors as output dimensions")
+
+    mean = vectors.mean(axis=0)
+    # Rows of vt are principal axes ordered by explained variance.
+    _, singular_values, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    components = vt[:dimension].astype(np.float32)
+
+    reduced = (vectors - mean) @ components.T
+    reduced /= np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12)
+    scale = float(np.percentile(np.abs(reduced), clip_percentile)) / 127.0
+
+    explained = float(
+        (singular_values[:dimension] ** 2).sum() / (singular_values**2).sum()
+    )
+    digest = hashlib.sha256(components.tobytes() + mean.astype(np.float32).tobytes())
+    return {
+        "components": components,
+        "mean": mean.astype(np.float32),
+        "scale": np.float32(scale),
+        "explained_variance": np.float32(explained),
+        "version": np.str_(f"pca{dimension}-{digest.hexdigest()[:12]}"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("vectors", help=".npy file of corpus BGE-M3 vectors")
+    parser.add_argument("output", help="destination .npz artifact")
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--clip-percentile", type=float, default=99.9)
+    args = parser.parse_args()
+
+    vectors = np.load(args.vectors).astype(np.float64)
+    artifact = fit_projection(vectors, args.dimension, args.clip_percentile)
+    np.savez(args.output, **artifact)
+    print(
+        f"wrote {args.output}: version={artifact['version']} "
+        f"explained_variance={float(artifact['explained_variance']):.3f} "
+        f"int8_scale={float(artifact['scale']):.6f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
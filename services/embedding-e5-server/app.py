@@ -1,55 +1,157 @@
 import asyncio
 import hmac
+import logging
 import os
+import time
 from contextlib import asynccontextmanager
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 
-import torch
-import torch.nn.functional as F
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 from pydantic import BaseModel, Field
-from sentence_transformers import SentenceTransformer
-from transformers import AutoModel, AutoTokenizer
+
+if TYPE_CHECKING:
+    import torch
+    from sentence_transformers import SentenceTransformer
 
 
 MODEL_PATH = os.getenv("MODEL_PATH", "/app/model")
 DEVICE = os.getenv("DEVICE", "cpu")
+# sentence-transformers (torch), onnx (sentence-transformers ONNX backend, needs
+# requirements-onnx.txt) or transformers (plain AutoModel + pooling).
+BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
 MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "64"))
 MAX_LENGTH = int(os.getenv("MAX_LENGTH", "512"))
 EXPECTED_DIMENSION = 384
 API_TOKEN = os.getenv("EMBEDDING_API_TOKEN")
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+# The transformers backend counts tokens from the inputs it already builds; the
+# sentence-transformers backends tokenize inside encode(), so counting costs a
+# second tokenizer pass and is opt-in.
+TOKEN_METRICS = os.getenv("TOKEN_METRICS", "false").lower() == "true"
 ALLOWED_ORIGINS = [
     origin.strip()
     for origin in os.getenv("ALLOWED_ORIGINS", "").split(",")
     if origin.strip()
 ]
 
-st_model: SentenceTransformer | None = None
+if BACKEND not in {"sentence-transformers", "onnx", "transformers"}:
+    raise RuntimeError(f"unsupported EMBEDDING_BACKEND={BACKEND}")
+
+st_model: "SentenceTransformer | None" = None
 hf_model = None
 hf_tokenizer = None
 encode_lock: asyncio.Lock | None = None
+ready = False
+startup_error: str | None = None
+startup_task: asyncio.Task | None = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOCK_WAIT_SECONDS = Histogram(
+    "embedding_lock_wait_seconds",
+    "Time a request waited for encode_lock",
+    buckets=LATENCY_BUCKETS,
+)
+ENCODE_SECONDS = Histogram(
+    "embedding_encode_seconds",
+    "Model encode time per request",
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Texts per encode call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+INPUT_TOKENS = Histogram(
+    "embedding_input_tokens",
+    "Tokens per input text after truncation",
+    buckets=(8, 16, 32, 64, 128, 256, 384, 512, 768, 1024),
+)
+PADDING_RATIO = Histogram(
+    "embedding_padding_ratio",
+    "Share of padding tokens when a request is padded to its longest input",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9),
+)
+VECTORS_TOTAL = Counter("embedding_vectors_total", "Vectors produced")
+VECTORS_PER_SECOND = Gauge(
+    "embedding_vectors_per_second",
+    "Encode throughput of the most recent request",
+)
 
 
 def _load_model() -> None:
+    """Import only the configured backend and load the model once."""
     global st_model, hf_model, hf_tokenizer
-    try:
-        st_model = SentenceTransformer(MODEL_PATH, device=DEVICE)
-        st_model.max_seq_length = MAX_LENGTH
-    except Exception:
+    profile: list[tuple[str, float]] = []
+    started = time.perf_counter()
+
+    def mark(step: str) -> None:
+        nonlocal started
+        now = time.perf_counter()
+        profile.append((step, now - started))
+        started = now
+
+    if BACKEND == "transformers":
+        import torch  # noqa: F401
+
+        mark("import torch")
+        from transformers import AutoModel, AutoTokenizer
+
+        mark("import transformers")
         hf_tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
         hf_model = AutoModel.from_pretrained(MODEL_PATH).to(DEVICE)
         hf_model.eval()
+    else:
+        if BACKEND == "onnx":
+            try:
+                import optimum.onnxruntime  # noqa: F401
+            except ImportError as error:
+                raise RuntimeError(
+                    "EMBEDDING_BACKEND=onnx needs the packages in requirements-onnx.txt"
+                ) from error
+            mark("import optimum.onnxruntime")
+        from sentence_transformers import SentenceTransformer
+
+        mark("import sentence_transformers")
+        st_model = SentenceTransformer(
+            MODEL_PATH,
+            device=DEVICE,
+            **({"backend": "onnx"} if BACKEND == "onnx" else {}),
+        )
+        st_model.max_seq_length = MAX_LENGTH
+    mark("load model")
+    logging.info(
+        "Startup profile (backend=%s): %s",
+        BACKEND,
+        ", ".join(f"{step} {seconds:.2f}s" for step, seconds in profile),
+    )
+
+
+async def _start_up() -> None:
+    global ready, startup_error
+    try:
+        await asyncio.to_thread(_load_model)
+        if st_model is None and hf_model is None:
+            raise RuntimeError("E5 model failed to load")
+        if WARMUP_ENABLED:
+            await asyncio.to_thread(_encode, [_prefix("warm-up", "query")])
+        ready = True
+    except Exception as error:
+        logging.exception("E5 server failed to start")
+        startup_error = str(error)
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    global encode_lock
-    await asyncio.to_thread(_load_model)
-    if st_model is None and hf_model is None:
-        raise RuntimeError("E5 model failed to load")
+    global encode_lock, startup_task
     encode_lock = asyncio.Lock()
+    # Load in the background so the port opens immediately; /readyz (and the
+    # existing /healthz) report 503 until the model can serve requests.
+    startup_task = asyncio.create_task(_start_up())
     yield
+    startup_task.cancel()
 
 
 app = FastAPI(title="Studify E5 Embeddings", version="2.0.0", lifespan=lifespan)
@@ -88,15 +190,33 @@ def _prefix(text: str, task: Literal["query", "passage"]) -> str:
     return f"{task}: {text.strip()}"
 
 
-def _mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor):
+def _mean_pool(last_hidden_state: "torch.Tensor", attention_mask: "torch.Tensor"):
+    import torch
+
     mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
     summed = torch.sum(last_hidden_state * mask, dim=1)
     counts = torch.clamp(mask.sum(dim=1), min=1e-9)
     return summed / counts
 
 
+def _observe_tokens(lengths: list[int]) -> None:
+    for length in lengths:
+        INPUT_TOKENS.observe(length)
+    longest = max(lengths, default=0)
+    if longest:
+        PADDING_RATIO.observe(1 - sum(lengths) / (longest * len(lengths)))
+
+
 def _encode(texts: list[str]) -> list[list[float]]:
     if st_model is not None:
+        if TOKEN_METRICS:
+            lengths = st_model.tokenizer(
+                texts,
+                truncation=True,
+                max_length=MAX_LENGTH,
+                return_length=True,
+            )["length"]
+            _observe_tokens(list(lengths))
         return st_model.encode(
             texts,
             batch_size=min(32, len(texts)),
@@ -107,6 +227,9 @@ def _encode(texts: list[str]) -> list[list[float]]:
 
     if hf_model is None or hf_tokenizer is None:
         raise RuntimeError("model is not loaded")
+    import torch
+    import torch.nn.functional as F
+
     inputs = hf_tokenizer(
         texts,
         padding=True,
@@ -114,6 +237,7 @@ def _encode(texts: list[str]) -> list[list[float]]:
         max_length=MAX_LENGTH,
         return_tensors="pt",
     ).to(DEVICE)
+    _observe_tokens(inputs["attention_mask"].sum(dim=1).tolist())
     with torch.inference_mode():
         outputs = hf_model(**inputs)
         pooled = _mean_pool(outputs.last_hidden_state, inputs["attention_mask"])
@@ -121,15 +245,35 @@ def _encode(texts: list[str]) -> list[list[float]]:
     return normalized.cpu().tolist()
 
 
-async def _encode_safely(texts: list[str]) -> list[list[float]]:
+async def _encode_safely(
+    texts: list[str],
+    response: Response | None = None,
+) -> list[list[float]]:
     if len(texts) > MAX_BATCH_SIZE:
         raise HTTPException(413, f"batch exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}")
     if any(not text.strip() for text in texts):
         raise HTTPException(422, "inputs cannot contain empty strings")
+    if not ready:
+        raise HTTPException(503, startup_error or "model is loading")
     assert encode_lock is not None
+    wait_started = time.perf_counter()
     async with encode_lock:
+        lock_wait = time.perf_counter() - wait_started
+        LOCK_WAIT_SECONDS.observe(lock_wait)
+        BATCH_SIZE.observe(len(texts))
         try:
+            encode_started = time.perf_counter()
             vectors = await asyncio.to_thread(_encode, texts)
+            encode_time = time.perf_counter() - encode_started
+            ENCODE_SECONDS.observe(encode_time)
+            VECTORS_TOTAL.inc(len(vectors))
+            if encode_time > 0:
+                VECTORS_PER_SECOND.set(len(vectors) / encode_time)
+            if SERVER_TIMING and response is not None:
+                response.headers["Server-Timing"] = (
+                    f"lock;dur={lock_wait * 1000:.1f}, "
+                    f"encode;dur={encode_time * 1000:.1f}"
+                )
             if any(len(vector) != EXPECTED_DIMENSION for vector in vectors):
                 raise RuntimeError(
                     f"model dimension mismatch; expected {EXPECTED_DIMENSION}"
@@ -141,11 +285,24 @@ async def _encode_safely(texts: list[str]) -> list[list[float]]:
             raise HTTPException(500, f"embedding failed: {error}") from error
 
 
+@app.get("/metrics")
+async def metrics():
+    payload = await asyncio.to_thread(generate_latest)
+    return Response(payload, media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/")
+async def liveness():
+    if startup_error:
+        raise HTTPException(503, f"startup failed: {startup_error}")
+    return {"status": "ok" if ready else "loading", "ready": ready}
+
+
 @app.get("/healthz")
+@app.get("/readyz")
 async def health():
-    if st_model is None and hf_model is None:
-        raise HTTPException(503, "model not loaded")
+    if not ready:
+        raise HTTPException(503, startup_error or "model is loading")
     return {
         "status": "ok",
         "device": DEVICE,
@@ -157,21 +314,27 @@ async def health():
 @app.post("/embed")
 async def embed(
     request: EmbeddingRequest,
+    response: Response,
     authorization: str | None = Header(default=None),
 ):
     _authorize(authorization)
-    vectors = await _encode_safely([_prefix(request.input, request.task)])
+    vectors = await _encode_safely(
+        [_prefix(request.input, request.task)],
+        response,
+    )
     return {"embedding": vectors[0], "dim": len(vectors[0])}
 
 
 @app.post("/embed/batch")
 async def embed_batch(
     request: BatchRequest,
+    response: Response,
     authorization: str | None = Header(default=None),
 ):
     _authorize(authorization)
     vectors = await _encode_safely(
-        [_prefix(text, request.task) for text in request.inputs]
+        [_prefix(text, request.task) for text in request.inputs],
+        response,
     )
     return {
         "embeddings": vectors,
@@ -1,25 +1,36 @@
 import asyncio
+import dataclasses
 import hmac
+import json
 import logging
+import mmap
 import os
 import shutil
+import socket
 import subprocess
+import sys
 import tempfile
 import time
 import uuid
+import wave
+from collections import OrderedDict
+from concurrent.futures import Future
 from contextlib import asynccontextmanager
 from pathlib import Path
-from threading import Lock
+from threading import Condition, Event, Lock, Thread
 from typing import Literal
 from urllib.parse import urlparse
 
 import httpx
-from fastapi import FastAPI, File, Header, HTTPException, Query, UploadFile
-from fastapi.responses import JSONResponse
-from faster_whisper import WhisperModel
-from mega import Mega
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.utils import download_model
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 from pydantic import BaseModel, Field
+from python_multipart.multipart import MultipartParser, parse_options_header
 from supabase import Client, create_client
+from tokenizers import Tokenizer
 
 
 logging.basicConfig(
@@ -28,14 +39,45 @@ logging.basicConfig(
 )
 
 MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+# Pre-converted CTranslate2 directory baked into the image; skips the Hub when set.
+MODEL_PATH = os.getenv("WHISPER_MODEL_PATH")
+WARMUP_SECONDS = float(os.getenv("WHISPER_WARMUP_SECONDS", "2"))
 DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
 COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+# Optional per-language routing, e.g. "en=distil-small.en:int8,zh=medium:int8".
+LANGUAGE_ROUTES = os.getenv("WHISPER_LANGUAGE_ROUTES", "")
+LANGUAGE_PROBE_SECONDS = float(os.getenv("LANGUAGE_PROBE_SECONDS", "30"))
+LANGUAGE_ROUTE_MIN_PROBABILITY = float(
+    os.getenv("LANGUAGE_ROUTE_MIN_PROBABILITY", "0.8")
+)
+MODEL_CACHE_BYTES = int(os.getenv("WHISPER_MODEL_CACHE_MB", "4096")) * 1024 * 1024
+# Cross-job batching: VAD windows from every active job are decoded together.
+BATCHED_INFERENCE = os.getenv("WHISPER_BATCHED_INFERENCE", "false").lower() == "true"
+ASR_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "16"))
+ASR_BATCH_WAIT_MS = int(os.getenv("WHISPER_BATCH_WAIT_MS", "50"))
 MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+# Starting audio-seconds-per-wall-second for ASR time estimates; then the measured factor.
+ASR_ESTIMATED_REALTIME_FACTOR = float(os.getenv("ASR_ESTIMATED_REALTIME_FACTOR", "4"))
 MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Uploads stream into ffmpeg as they arrive unless the original must be kept (see _ingest_upload).
+TRANSCODE_ON_UPLOAD = os.getenv("TRANSCODE_ON_UPLOAD", "true").lower() == "true"
+# How much of an MP4/MOV head to buffer while looking for the first moov/mdat atom.
+UPLOAD_SNIFF_BYTES = 4 * 1024 * 1024
+# Uploads up to this size (and SHORT_CLIP_MAX_SECONDS) are decoded in memory on their own lane.
+SHORT_CLIP_MAX_BYTES = int(os.getenv("SHORT_CLIP_MAX_BYTES", str(8 * 1024 * 1024)))
+SHORT_CLIP_MAX_SECONDS = float(os.getenv("SHORT_CLIP_MAX_SECONDS", "120"))
+SHORT_CLIP_CONCURRENCY = int(os.getenv("SHORT_CLIP_CONCURRENCY", "1"))
 FFMPEG_TIMEOUT_SECONDS = int(os.getenv("FFMPEG_TIMEOUT_SECONDS", "900"))
+# How often blocking stages look at a job's cancellation token.
+CANCEL_POLL_SECONDS = 0.25
 WHISPER_API_TOKEN = os.getenv("WHISPER_API_TOKEN")
 JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "86400"))
 TEMP_DIR = Path(os.getenv("WHISPER_TEMP_DIR", tempfile.gettempdir()))
+# Bytes of TEMP_DIR that admitted jobs may reserve; 0 means 90% of the free space at startup.
+TEMP_DISK_BUDGET_BYTES = int(os.getenv("TEMP_DISK_BUDGET_BYTES", "0"))
+# 16 kHz s16 mono PCM, about 115 MB per hour of audio.
+WAV_BYTES_PER_SECOND = 16000 * 2
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 E5_EMBEDDING_URL = os.getenv(
@@ -54,17 +96,76 @@ SEMANTIC_SIMILARITY_THRESHOLD = float(
 )
 MIN_CHUNK_CHARS = int(os.getenv("MIN_CHUNK_CHARS", "300"))
 MAX_CHUNK_CHARS = int(os.getenv("MAX_CHUNK_CHARS", "900"))
+# Token budgets follow the E5 server's 512-token limit; character limits are the fallback.
+CHUNK_TOKENIZER = os.getenv(
+    "CHUNK_TOKENIZER", str(Path(__file__).with_name("chunk_tokenizer.json"))
+)
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", "128"))
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "512"))
 MAX_SEGMENT_GAP_SECONDS = float(os.getenv("MAX_SEGMENT_GAP_SECONDS", "8"))
 FASTSTART_ENABLED = os.getenv("FASTSTART_ENABLED", "true").lower() == "true"
+# Relocate moov natively (one sequential copy); ffmpeg remux stays as the fallback.
+FASTSTART_NATIVE = os.getenv("FASTSTART_NATIVE", "true").lower() == "true"
+FASTSTART_COPY_CHUNK_BYTES = 16 * 1024 * 1024
+# Atoms on the path from moov to the stco/co64 chunk offset tables.
+MP4_OFFSET_CONTAINERS = {"trak", "mdia", "minf", "stbl"}
+# Compressed headers, fragments and aux-info offsets are left to ffmpeg.
+MP4_UNSUPPORTED_ATOMS = {"cmov", "mvex", "saio"}
+# Claimed queue rows carry a lease renewed while the job runs; expired rows are re-queued.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "120"))
+QUEUE_HEARTBEAT_SECONDS = float(os.getenv("QUEUE_HEARTBEAT_SECONDS", "30"))
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "10"))
+# Pull mode: also claim pending transcription rows instead of only waiting for POST /transcribe.
+WORKER_MODE = os.getenv("WORKER_MODE", "false").lower() == "true"
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "5"))
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", str(MAX_CONCURRENT_JOBS)))
+# The Next.js caller requests beam_size=1; pulled jobs decode the same way.
+WORKER_BEAM_SIZE = int(os.getenv("WORKER_BEAM_SIZE", "1"))
 MEGA_EMAIL = os.getenv("MEGA_EMAIL")
 MEGA_PASSWORD = os.getenv("MEGA_PASSWORD")
 
+# Request-level decode profiles; without one the caller's beam_size is used.
+DECODE_PROFILES: dict[str, dict] = {
+    "fast": {
+        "beam_size": 1,
+        "best_of": 1,
+        "word_timestamps": False,
+        "without_timestamps": True,
+    },
+    "accurate": {
+        "beam_size": 5,
+        "word_timestamps": True,
+        "without_timestamps": False,
+    },
+}
+
 model: WhisperModel | None = None
+# (model size, compute type) -> cached model, least recently used first; never the default.
+routed_models: OrderedDict[tuple[str, str], "_RoutedModel"] = OrderedDict()
+# Loads in flight, so concurrent jobs routed to the same model wait for one load.
+routed_model_loads: dict[tuple[str, str], Future] = {}
+routed_models_lock = Lock()
+batch_engines: dict[int, "AsrBatchEngine"] = {}
+batch_engines_lock = Lock()
 semaphore: asyncio.Semaphore | None = None
+short_clip_semaphore: asyncio.Semaphore | None = None
+disk_budget: "DiskBudget | None" = None
 jobs: dict[str, dict] = {}
 tasks: dict[str, asyncio.Task] = {}
+# Set by DELETE /jobs and shutdown; worker threads poll it and stop their child processes.
+cancel_tokens: dict[str, Event] = {}
+# "requested" (DELETE /jobs) or "lease_lost" (heartbeat); a missing reason is a shutdown.
+cancel_reasons: dict[str, str] = {}
 jobs_lock = Lock()
 supabase: Client | None = None
+ready = False
+startup_error: str | None = None
+startup_task: asyncio.Task | None = None
+worker_task: asyncio.Task | None = None
+chunk_tokenizer: Tokenizer | None = None
+chunk_token_overhead = 0
+asr_realtime_factor = ASR_ESTIMATED_REALTIME_FACTOR
 
 
 class TranscriptSegment(BaseModel):
@@ -73,6 +174,8 @@ class TranscriptSegment(BaseModel):
     end: float = Field(ge=0)
     confidence: float | None = Field(default=None, ge=0, le=1)
     speaker: str | None = None
+    # Compact [start, end, word] triples; only present for the accurate profile.
+    words: list[tuple[float, float, str]] | None = None
 
 
 class TranscriptResult(BaseModel):
@@ -80,9 +183,181 @@ class TranscriptResult(BaseModel):
     language: str | None
     language_probability: float | None = None
     duration: float
+    model: str | None = None
     segments: list[TranscriptSegment]
 
 
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+STAGE_SECONDS = Histogram(
+    "whisper_job_stage_seconds",
+    "Wall time of each ingestion stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+SEMAPHORE_WAIT_SECONDS = Histogram(
+    "whisper_semaphore_wait_seconds",
+    "Time a job waited for an ASR slot",
+    buckets=STAGE_BUCKETS,
+)
+ASR_REALTIME_FACTOR = Gauge(
+    "whisper_asr_realtime_factor",
+    "Audio seconds transcribed per wall second for the most recent job",
+)
+ASR_AUDIO_SECONDS = Counter(
+    "whisper_asr_audio_seconds_total",
+    "Audio seconds transcribed",
+)
+ASR_WALL_SECONDS = Counter(
+    "whisper_asr_wall_seconds_total",
+    "Wall seconds spent in ASR decoding",
+)
+JOBS_FINISHED = Counter(
+    "whisper_jobs_finished_total",
+    "Jobs that reached a terminal state",
+    ["status"],
+)
+QUEUE_DEPTH = Gauge("whisper_jobs_queued", "Jobs waiting for an ASR slot")
+ACTIVE_JOBS = Gauge("whisper_jobs_processing", "Jobs holding an ASR slot")
+TEMP_DISK_BYTES = Gauge(
+    "whisper_temp_disk_bytes",
+    "Bytes used by studify-* temporary files in TEMP_DIR",
+)
+TEMP_DISK_FREE_BYTES = Gauge(
+    "whisper_temp_disk_free_bytes",
+    "Free bytes on the TEMP_DIR filesystem",
+)
+TEMP_DISK_BUDGET = Gauge(
+    "whisper_temp_disk_budget_bytes",
+    "TEMP_DIR bytes that admitted jobs may reserve",
+)
+TEMP_DISK_RESERVED = Gauge(
+    "whisper_temp_disk_reserved_bytes",
+    "TEMP_DIR bytes reserved by admitted jobs",
+)
+DISK_WAITING_JOBS = Gauge(
+    "whisper_jobs_waiting_for_disk",
+    "Jobs held back until the temp-disk budget has room",
+)
+DISK_WAIT_SECONDS = Histogram(
+    "whisper_temp_disk_wait_seconds",
+    "Time a job waited for its temp-disk reservation",
+    buckets=STAGE_BUCKETS,
+)
+
+
+def _parse_language_routes(value: str) -> dict[str, tuple[str, str]]:
+    routes: dict[str, tuple[str, str]] = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        language, _, target = entry.partition("=")
+        size, _, compute_type = target.partition(":")
+        if not language.strip() or not size.strip():
+            raise RuntimeError(f"invalid WHISPER_LANGUAGE_ROUTES entry: {entry!r}")
+        routes[language.strip()] = (size.strip(), compute_type.strip() or COMPUTE_TYPE)
+    return routes
+
+
+language_routes = _parse_language_routes(LANGUAGE_ROUTES)
+
+
+def _count_jobs(status: str) -> int:
+    with jobs_lock:
+        return sum(1 for job in jobs.values() if job.get("status") == status)
+
+
+def _temp_disk_usage() -> int:
+    total = 0
+    for entry in TEMP_DIR.glob("studify-*"):
+        try:
+            if entry.is_dir():
+                total += sum(
+                    item.stat().st_size for item in entry.rglob("*") if item.is_file()
+                )
+            else:
+                total += entry.stat().st_size
+        except FileNotFoundError:
+            # Jobs delete their temp files concurrently with scrapes.
+            continue
+    return total
+
+
+QUEUE_DEPTH.set_function(lambda: _count_jobs("queued"))
+ACTIVE_JOBS.set_function(lambda: _count_jobs("processing"))
+TEMP_DISK_BYTES.set_function(_temp_disk_usage)
+TEMP_DISK_FREE_BYTES.set_function(lambda: shutil.disk_usage(TEMP_DIR).free)
+TEMP_DISK_BUDGET.set_function(lambda: disk_budget.capacity if disk_budget else 0)
+TEMP_DISK_RESERVED.set_function(lambda: disk_budget.reserved if disk_budget else 0)
+DISK_WAITING_JOBS.set_function(lambda: disk_budget.waiting if disk_budget else 0)
+
+
+def _sweep_orphaned_temp_files() -> int:
+    """Remove studify-* entries left in TEMP_DIR by a previous process."""
+    removed = 0
+    for entry in TEMP_DIR.glob("studify-*"):
+        try:
+            if entry.is_dir():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+            removed += 1
+        except FileNotFoundError:
+            continue
+        except OSError:
+            logging.exception("Could not remove orphaned temp entry %s", entry)
+    return removed
+
+
+class DiskBudget:
+    """Admission control for TEMP_DIR; admitted reservations resize without waiting again."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.reserved = 0
+        self.waiting = 0
+        self.condition = asyncio.Condition()
+
+    async def admit(self, size: int) -> "DiskReservation":
+        started = time.monotonic()
+        async with self.condition:
+            self.waiting += 1
+            try:
+                await self.condition.wait_for(
+                    lambda: self.reserved == 0 or self.reserved + size <= self.capacity
+                )
+            finally:
+                self.waiting -= 1
+            self.reserved += size
+        DISK_WAIT_SECONDS.observe(time.monotonic() - started)
+        return DiskReservation(self, size)
+
+    async def try_admit(self, size: int) -> "DiskReservation | None":
+        async with self.condition:
+            if self.reserved and self.reserved + size > self.capacity:
+                return None
+            self.reserved += size
+        return DiskReservation(self, size)
+
+    async def _adjust(self, delta: int) -> None:
+        async with self.condition:
+            self.reserved += delta
+            if delta < 0:
+                self.condition.notify_all()
+
+
+class DiskReservation:
+    def __init__(self, budget: DiskBudget, size: int):
+        self.budget = budget
+        self.size = size
+
+    async def resize(self, size: int) -> None:
+        delta, self.size = size - self.size, size
+        await self.budget._adjust(delta)
+
+    async def release(self) -> None:
+        await self.resize(0)
+
+
 def _cleanup_stale_jobs() -> None:
     cutoff = time.time() - JOB_TTL_SECONDS
     with jobs_lock:
@@ -96,61 +371,272 @@ def _cleanup_stale_jobs() -> None:
             jobs.pop(job_id, None)
 
 
-@asynccontextmanager
-async def lifespan(_: FastAPI):
-    global model, semaphore, supabase
+def _load_chunk_tokenizer() -> None:
+    global chunk_tokenizer, chunk_token_overhead
+    try:
+        if Path(CHUNK_TOKENIZER).is_file():
+            tokenizer = Tokenizer.from_file(CHUNK_TOKENIZER)
+        elif CHUNK_TOKENIZER.endswith(".json"):
+            raise FileNotFoundError("no such file")
+        else:
+            logging.warning(
+                "Downloading chunk tokenizer %s from the Hugging Face Hub; "
+                "ship a tokenizer.json to avoid this on cold starts",
+                CHUNK_TOKENIZER,
+            )
+            tokenizer = Tokenizer.from_pretrained(CHUNK_TOKENIZER)
+    except Exception as exc:
+        logging.warning(
+            "Chunk tokenizer %s unavailable (%s); transcript chunks fall back to "
+            "MIN_CHUNK_CHARS/MAX_CHUNK_CHARS instead of token limits",
+            CHUNK_TOKENIZER,
+            exc,
+        )
+        return
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    # The E5 server embeds "passage: <text>" wrapped in special tokens.
+    chunk_token_overhead = len(tokenizer.encode("passage: ").ids)
+    chunk_tokenizer = tokenizer
+
+
+def _load_whisper_model() -> WhisperModel:
     logging.info(
         "Loading Whisper model=%s device=%s compute_type=%s",
-        MODEL_SIZE,
+        MODEL_PATH or MODEL_SIZE,
         DEVICE,
         COMPUTE_TYPE,
     )
-    model = await asyncio.to_thread(
-        WhisperModel,
-        MODEL_SIZE,
-        device=DEVICE,
-        compute_type=COMPUTE_TYPE,
-    )
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+    started = time.monotonic()
+    if MODEL_PATH:
+        loaded = WhisperModel(
+            MODEL_PATH,
+            device=DEVICE,
+            compute_type=COMPUTE_TYPE,
+            local_files_only=True,
+        )
+    else:
+        loaded = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE)
+    logging.info("Whisper model loaded in %.1fs", time.monotonic() - started)
+    return loaded
+
+
+def _warm_up(whisper: WhisperModel) -> None:
+    """Run one decode on built-in silence so the first job skips kernel warm-up."""
+    if WARMUP_SECONDS <= 0:
+        return
+    import numpy as np
+
+    started = time.monotonic()
+    silence = np.zeros(int(16000 * WARMUP_SECONDS), dtype=np.float32)
+    segments, _ = whisper.transcribe(silence, language="en", beam_size=1)
+    for _ in segments:
+        pass
+    logging.info("Whisper warm-up finished in %.1fs", time.monotonic() - started)
+
+
+async def _start_up() -> None:
+    global model, supabase, ready, startup_error, worker_task
+    try:
+        model = await asyncio.to_thread(_load_whisper_model)
+        await asyncio.to_thread(_warm_up, model)
+        await asyncio.to_thread(_load_chunk_tokenizer)
+        client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        await asyncio.to_thread(
+            lambda: client.table("video_processing_queue").select("id").limit(1).execute()
+        )
+        supabase = client
+        ready = True
+        logging.info("Whisper service is ready")
+        if WORKER_MODE:
+            worker_task = asyncio.create_task(_worker_loop())
+    except Exception as error:
+        logging.exception("Whisper service failed to start")
+        startup_error = str(error)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global semaphore, short_clip_semaphore, disk_budget, startup_task
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         raise RuntimeError("Supabase service credentials are required")
-    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    await asyncio.to_thread(
-        lambda: supabase.table("video_processing_queue").select("id").limit(1).execute()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+    short_clip_semaphore = asyncio.Semaphore(SHORT_CLIP_CONCURRENCY)
+    removed = await asyncio.to_thread(_sweep_orphaned_temp_files)
+    if removed:
+        logging.warning("Removed %d orphaned temp entries from %s", removed, TEMP_DIR)
+    disk_budget = DiskBudget(
+        TEMP_DISK_BUDGET_BYTES or int(shutil.disk_usage(TEMP_DIR).free * 0.9)
     )
+    # Load in the background so the port opens at once; /readyz reports when ready.
+    startup_task = asyncio.create_task(_start_up())
     yield
-    for task in list(tasks.values()):
+    startup_task.cancel()
+    if worker_task is not None:
+        worker_task.cancel()
+    for token in list(cancel_tokens.values()):
+        token.set()
+    running = list(tasks.values())
+    for task in running:
         task.cancel()
+    if running:
+        # Let cancelled jobs hand their queue leases back before the loop goes away.
+        await asyncio.wait(running, timeout=SHUTDOWN_GRACE_SECONDS)
+    with batch_engines_lock:
+        engines = list(batch_engines.values())
+        batch_engines.clear()
+    for engine in engines:
+        engine.stop()
 
 
 app = FastAPI(title="Studify Whisper ASR", version="2.0.0", lifespan=lifespan)
 
 
+@app.get("/metrics")
+async def metrics():
+    payload = await asyncio.to_thread(generate_latest)
+    return Response(payload, media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/healthz")
+async def liveness():
+    if startup_error:
+        raise HTTPException(503, f"startup failed: {startup_error}")
+    return {"status": "ok", "ready": ready}
+
+
+@app.get("/readyz")
+async def readiness():
+    if not ready:
+        raise HTTPException(503, startup_error or "starting")
+    return {"status": "ready"}
+
+
 @app.get("/")
 async def health():
+    with routed_models_lock:
+        loaded = list(routed_models)
+    with jobs_lock:
+        active_jobs = sum(
+            1 for job in jobs.values() if job.get("status") in {"queued", "processing"}
+        )
     return {
         "status": "ok",
+        "ready": ready,
         "model": MODEL_SIZE,
         "device": DEVICE,
-        "active_jobs": sum(
-            1 for job in jobs.values() if job.get("status") in {"queued", "processing"}
-        ),
+        "routed_models": [f"{size}:{compute_type}" for size, compute_type in loaded],
+        "active_jobs": active_jobs,
     }
 
 
-async def _save_upload(upload: UploadFile) -> Path:
+class StreamedUpload:
+    """The "file" part of a multipart/form-data request, parsed from the body as it arrives."""
+
+    def __init__(self, request: Request):
+        content_type, options = parse_options_header(request.headers.get("content-type"))
+        boundary = options.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise HTTPException(400, "expected a multipart/form-data body with a file field")
+        self.filename: str | None = None
+        self._stream = request.stream()
+        self._pending = bytearray()
+        self._header_field = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._in_file = False
+        self._found = False
+        self._done = False
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field = data[start:end].lower()
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._headers[self._header_field] = self._headers.get(self._header_field, b"") + (
+            data[start:end]
+        )
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if not self._found and options.get(b"name") == b"file" and b"filename" in options:
+            self._found = self._in_file = True
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._pending += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._in_file = False
+            self._done = True
+
+    async def _feed(self) -> None:
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            if self._in_file:
+                raise HTTPException(400, "request body ended inside the file field") from None
+            self._done = True
+            return
+        try:
+            self._parser.write(chunk)
+        except Exception as error:
+            raise HTTPException(400, f"malformed multipart body: {error}") from error
+
+    async def start(self) -> None:
+        """Read up to the file part's headers, so the filename is known before any data."""
+        while not self._found and not self._done:
+            await self._feed()
+        if not self._found:
+            raise HTTPException(400, "provide exactly one of file or url")
+
+    async def read(self, size: int = -1) -> bytes:
+        """Return file bytes as soon as some are available; b"" once the part has ended."""
+        while (size < 0 or not self._pending) and not self._done:
+            await self._feed()
+        if size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    async def close(self) -> None:
+        self._pending.clear()
+        self._done = True
+
+
+async def _save_upload(upload: StreamedUpload, head: bytes = b"") -> Path:
     suffix = Path(upload.filename or "audio.bin").suffix[:12] or ".bin"
+    if _is_mp4_upload(upload, head) and not _is_faststart_compatible(Path(suffix)):
+        # Probe and Fast Start key off the suffix; keep an MP4 recognisable on disk.
+        suffix = ".mp4"
     fd, name = tempfile.mkstemp(prefix="studify-asr-", suffix=suffix, dir=TEMP_DIR)
     os.close(fd)
     path = Path(name)
-    total = 0
+    total = len(head)
     try:
         with path.open("wb") as output:
-            while chunk := await upload.read(1024 * 1024):
+            if head:
+                await asyncio.to_thread(output.write, head)
+            while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
                 total += len(chunk)
                 if total > MAX_UPLOAD_BYTES:
                     raise HTTPException(413, "uploaded media exceeds size limit")
-                output.write(chunk)
+                await asyncio.to_thread(output.write, chunk)
         return path
     except Exception:
         path.unlink(missing_ok=True)
@@ -159,14 +645,271 @@ async def _save_upload(upload: UploadFile) -> Path:
         await upload.close()
 
 
-def _download_mega(url: str) -> Path:
+def _is_mp4_upload(upload: StreamedUpload, head: bytes) -> bool:
+    """An MP4/MOV by name, or by its leading ftyp box whatever the file is called."""
+    return _is_faststart_compatible(Path(upload.filename or "audio.bin")) or head[4:8] == b"ftyp"
+
+
+def _sniff_mp4_layout(head: bytes) -> Literal["faststart", "needs_faststart", "unknown"]:
+    """Top-level atom order from the first bytes of an MP4/MOV stream."""
+    offset = 0
+    while offset + 8 <= len(head):
+        atom_size = int.from_bytes(head[offset : offset + 4], "big")
+        atom_type = head[offset + 4 : offset + 8]
+        if atom_type == b"moov":
+            return "faststart"
+        if atom_type == b"mdat":
+            return "needs_faststart"
+        if atom_size == 1:
+            if offset + 16 > len(head):
+                break
+            atom_size = int.from_bytes(head[offset + 8 : offset + 16], "big")
+        if atom_size < 8:
+            break
+        offset += atom_size
+    return "unknown"
+
+
+async def _pipe_upload_to_wav(upload: StreamedUpload, head: bytes) -> Path:
+    """Feed the upload into ffmpeg's stdin as it arrives and write 16 kHz mono PCM."""
+    fd, name = tempfile.mkstemp(prefix="studify-asr-", suffix=".wav", dir=TEMP_DIR)
+    os.close(fd)
+    output = Path(name)
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        "pipe:0",
+        "-map",
+        "0:a:0",
+        "-vn",
+        "-ar",
+        "16000",
+        "-ac",
+        "1",
+        "-c:a",
+        "pcm_s16le",
+        str(output),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdin is not None and process.stderr is not None
+    stderr_task = asyncio.create_task(process.stderr.read())
+    total = len(head)
+    try:
+        try:
+            chunk = head
+            while chunk:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                total += len(chunk)
+                if total > MAX_UPLOAD_BYTES:
+                    raise HTTPException(413, "uploaded media exceeds size limit")
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg gave up on the input; its stderr below says why.
+            pass
+        await asyncio.wait_for(process.wait(), timeout=FFMPEG_TIMEOUT_SECONDS)
+        error = (await stderr_task).decode("utf-8", errors="replace")[-1000:]
+        if process.returncode != 0:
+            raise HTTPException(400, f"invalid media: {error}")
+        return output
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        stderr_task.cancel()
+        output.unlink(missing_ok=True)
+        raise
+
+
+def _decode_clip(data: bytes):
+    """Decode an in-memory upload to 16 kHz mono float32 in-process (PyAV)."""
+    import io
+
+    try:
+        audio = decode_audio(io.BytesIO(data), sampling_rate=16000)
+    except IndexError as error:
+        # PyAV's decode(audio=0) on a container without audio streams
+        raise ValueError("media has no audio stream") from error
+    except Exception as error:
+        raise ValueError(f"invalid media: {error}") from error
+    if not audio.size:
+        raise ValueError("media has no audio stream")
+    return audio
+
+
+def _clip_duration(data: bytes) -> float | None:
+    """Audio duration of an in-memory upload from its container headers, without decoding."""
+    import io
+
+    import av
+
+    try:
+        container = av.open(io.BytesIO(data), metadata_errors="ignore")
+    except Exception as error:
+        raise ValueError(f"invalid media: {error}") from error
+    with container:
+        if not container.streams.audio:
+            raise ValueError("media has no audio stream")
+        stream = container.streams.audio[0]
+        if stream.duration is not None and stream.time_base is not None:
+            return float(stream.duration * stream.time_base)
+        if container.duration is not None:
+            return container.duration / av.time_base
+    return None
+
+
+async def _ingest_short_clip(upload: StreamedUpload, attachment_id: int | None):
+    """Hold at most SHORT_CLIP_MAX_BYTES in memory; returns (source, clip, known Fast Start)."""
+    try:
+        data = b""
+        while len(data) <= SHORT_CLIP_MAX_BYTES:
+            chunk = await upload.read(min(UPLOAD_CHUNK_BYTES, SHORT_CLIP_MAX_BYTES + 1 - len(data)))
+            if not chunk:
+                break
+            data += chunk
+        if len(data) > SHORT_CLIP_MAX_BYTES:
+            source, known_faststart = await _ingest_upload(upload, attachment_id, data)
+            return source, None, known_faststart
+        if not data:
+            raise HTTPException(400, "uploaded media is empty")
+        # Attachments that need Fast Start, and long or unmeasured audio, take the file path.
+        known_faststart = None
+        if attachment_id is not None and FASTSTART_ENABLED and _is_mp4_upload(upload, data):
+            if _sniff_mp4_layout(data) != "faststart":
+                return await _save_upload(upload, data), None, None
+            known_faststart = {"status": "already_optimized", "was_optimized": False}
+        try:
+            duration = await asyncio.to_thread(_clip_duration, data)
+        except ValueError as error:
+            raise HTTPException(400, str(error)) from error
+        if duration is None or duration > SHORT_CLIP_MAX_SECONDS:
+            return await _save_upload(upload, data), None, None
+        try:
+            with STAGE_SECONDS.labels("clip_decode").time():
+                clip = await asyncio.to_thread(_decode_clip, data)
+        except ValueError as error:
+            raise HTTPException(400, str(error)) from error
+        return None, clip, known_faststart
+    finally:
+        await upload.close()
+
+
+async def _ingest_upload(
+    upload: StreamedUpload, attachment_id: int | None, head: bytes = b""
+) -> tuple[Path, dict | None]:
+    """Store or transcode an upload; returns the job source and a known Fast Start result."""
+    if not TRANSCODE_ON_UPLOAD:
+        return await _save_upload(upload, head), None
+    try:
+        layout = None
+        # Only an MP4/MOV whose moov follows mdat, or an unrecognised head, is spooled to disk.
+        while True:
+            if head:
+                if not _is_mp4_upload(upload, head):
+                    break
+                layout = _sniff_mp4_layout(head)
+                if layout != "unknown" or len(head) >= UPLOAD_SNIFF_BYTES:
+                    break
+            if not (chunk := await upload.read(UPLOAD_CHUNK_BYTES)):
+                break
+            head += chunk
+        if len(head) > MAX_UPLOAD_BYTES:
+            raise HTTPException(413, "uploaded media exceeds size limit")
+        if not head:
+            raise HTTPException(400, "uploaded media is empty")
+
+        if layout in {"needs_faststart", "unknown"}:
+            return await _save_upload(upload, head), None
+        with STAGE_SECONDS.labels("upload_transcode").time():
+            wav = await _pipe_upload_to_wav(upload, head)
+        faststart_result = (
+            {"status": "already_optimized", "was_optimized": False}
+            if layout == "faststart" and attachment_id is not None and FASTSTART_ENABLED
+            else None
+        )
+        return wav, faststart_result
+    finally:
+        await upload.close()
+
+
+class JobCancelled(Exception):
+    """The job's cancellation token was set while a blocking stage was running."""
+
+
+def _check_cancelled(cancel: Event | None) -> None:
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled("job was cancelled")
+
+
+def _run_process(
+    args: list[str],
+    timeout: float | None,
+    cancel: Event | None = None,
+) -> subprocess.CompletedProcess:
+    """subprocess.run(capture_output=True) that kills the child once ``cancel`` is set."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as process:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=CANCEL_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                timed_out = deadline is not None and time.monotonic() > deadline
+                if timed_out or (cancel is not None and cancel.is_set()):
+                    process.kill()
+                    process.communicate()
+                    if timed_out:
+                        raise subprocess.TimeoutExpired(args, timeout) from None
+                    raise JobCancelled("job was cancelled") from None
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+# MEGA transfers run in a child interpreter, since mega.py cannot be stopped mid-file.
+MEGA_DOWNLOAD_SCRIPT = """
+import sys
+from mega import Mega
+print(Mega().login().download_url(sys.argv[1], sys.argv[2]))
+"""
+MEGA_UPLOAD_SCRIPT = """
+import os, sys
+from mega import Mega
+account = Mega().login(os.environ["MEGA_EMAIL"], os.environ["MEGA_PASSWORD"])
+print(account.get_upload_link(account.upload(sys.argv[1])))
+"""
+
+
+def _run_mega(script: str, *args: str, cancel: Event | None = None) -> str:
+    result = _run_process([sys.executable, "-c", script, *args], None, cancel)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="replace")[-1000:]
+        raise RuntimeError(f"MEGA transfer failed: {error}")
+    lines = result.stdout.decode("utf-8", errors="replace").strip().splitlines()
+    if not lines:
+        raise RuntimeError("MEGA transfer returned no result")
+    return lines[-1]
+
+
+def _download_mega(url: str, cancel: Event | None = None) -> Path:
     parsed = urlparse(url)
     if parsed.scheme != "https" or parsed.hostname not in {"mega.nz", "www.mega.nz"}:
         raise ValueError("only HTTPS mega.nz URLs are supported")
 
     work_dir = Path(tempfile.mkdtemp(prefix="studify-mega-", dir=TEMP_DIR))
     try:
-        downloaded = Path(Mega().login().download_url(url, str(work_dir)))
+        downloaded = Path(
+            _run_mega(MEGA_DOWNLOAD_SCRIPT, url, str(work_dir), cancel=cancel)
+        )
         if not downloaded.exists():
             raise RuntimeError("MEGA download did not create a file")
         if downloaded.stat().st_size > MAX_UPLOAD_BYTES:
@@ -177,74 +920,224 @@ def _download_mega(url: str) -> Path:
         raise
 
 
-def _validate_media(path: Path) -> None:
-    result = subprocess.run(
+@dataclasses.dataclass(frozen=True)
+class MediaInfo:
+    """One ffprobe of a source, reused by every later stage of the job."""
+
+    path: Path
+    format_name: str
+    size: int
+    duration: float | None
+    audio_index: int | None
+    audio_codec: str | None
+    sample_rate: int | None
+    channels: int | None
+    has_video: bool
+    # Top-level atom order for MP4/MOV; None for other containers.
+    faststart: bool | None
+
+    @property
+    def is_asr_ready(self) -> bool:
+        """Already the 16 kHz mono PCM WAV that _convert_to_wav would produce."""
+        return (
+            "wav" in self.format_name.split(",")
+            and self.audio_codec == "pcm_s16le"
+            and self.sample_rate == 16000
+            and self.channels == 1
+        )
+
+    def estimated_asr_seconds(self) -> float | None:
+        if not self.duration:
+            return None
+        return round(self.duration / max(asr_realtime_factor, 0.01), 1)
+
+
+def _probe_media(path: Path, cancel: Event | None = None) -> MediaInfo:
+    result = _run_process(
         [
             "ffprobe",
             "-v",
             "error",
-            "-show_entries",
-            "format=duration",
+            "-show_streams",
+            "-show_format",
             "-of",
-            "default=noprint_wrappers=1:nokey=1",
+            "json",
             str(path),
         ],
-        capture_output=True,
-        timeout=30,
-        check=False,
+        30,
+        cancel,
     )
     if result.returncode != 0:
         error = result.stderr.decode("utf-8", errors="replace")[-1000:]
         raise ValueError(f"invalid media: {error}")
+    probe = json.loads(result.stdout or b"{}")
+    streams = probe.get("streams") or []
+    media_format = probe.get("format") or {}
+
+    audio_streams = [stream for stream in streams if stream.get("codec_type") == "audio"]
+    if not audio_streams:
+        raise ValueError("media has no audio stream")
+    # The container's default audio track, else the first one.
+    audio = next(
+        (
+            stream
+            for stream in audio_streams
+            if (stream.get("disposition") or {}).get("default")
+        ),
+        audio_streams[0],
+    )
+
+    def _number(value, kind):
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            return None
+
+    faststart = None
+    if _is_faststart_compatible(path):
+        atoms = _read_mp4_atom_positions(path)
+        if "moov" in atoms and "mdat" in atoms:
+            faststart = atoms["moov"] < atoms["mdat"]
+
+    return MediaInfo(
+        path=path,
+        format_name=media_format.get("format_name") or "",
+        size=path.stat().st_size,
+        duration=_number(media_format.get("duration"), float)
+        or _number(audio.get("duration"), float),
+        audio_index=_number(audio.get("index"), int),
+        audio_codec=audio.get("codec_name"),
+        sample_rate=_number(audio.get("sample_rate"), int),
+        channels=_number(audio.get("channels"), int),
+        has_video=any(
+            stream.get("codec_type") == "video"
+            and not (stream.get("disposition") or {}).get("attached_pic")
+            for stream in streams
+        ),
+        faststart=faststart,
+    )
+
+
+def _iter_mp4_atoms(buffer, start: int, end: int):
+    """Yield (type, offset, size, header_size) for each atom laid out in buffer[start:end]."""
+    offset = start
+    while offset + 8 <= end:
+        atom_size = int.from_bytes(buffer[offset : offset + 4], "big")
+        atom_type = bytes(buffer[offset + 4 : offset + 8]).decode("latin-1")
+        header_size = 8
+        if atom_size == 1:
+            if offset + 16 > end:
+                break
+            atom_size = int.from_bytes(buffer[offset + 8 : offset + 16], "big")
+            header_size = 16
+        elif atom_size == 0:
+            atom_size = end - offset
+        if atom_size < header_size or offset + atom_size > end:
+            break
+        yield atom_type, offset, atom_size, header_size
+        offset += atom_size
 
 
 def _read_mp4_atom_positions(path: Path) -> dict[str, int]:
     positions: dict[str, int] = {}
-    file_size = path.stat().st_size
-    with path.open("rb") as source:
-        offset = 0
-        while offset + 8 <= file_size:
-            source.seek(offset)
-            header = source.read(16)
-            if len(header) < 8:
-                break
-            atom_size = int.from_bytes(header[0:4], "big")
-            atom_type = header[4:8].decode("latin-1")
-            header_size = 8
-            if atom_size == 1:
-                if len(header) < 16:
-                    break
-                atom_size = int.from_bytes(header[8:16], "big")
-                header_size = 16
-            elif atom_size == 0:
-                atom_size = file_size - offset
-            if atom_size < header_size or offset + atom_size > file_size:
-                break
+    if path.stat().st_size == 0:
+        return positions
+    with path.open("rb") as source, mmap.mmap(
+        source.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        for atom_type, offset, _, _ in _iter_mp4_atoms(buffer, 0, len(buffer)):
             positions.setdefault(atom_type, offset)
-            offset += atom_size
     return positions
 
 
-def _is_faststart_compatible(path: Path) -> bool:
-    return path.suffix.lower() in {".mp4", ".m4v", ".mov"}
+class FaststartUnsupported(Exception):
+    """The native relocator cannot rewrite this file; ffmpeg handles it instead."""
+
+
+def _patch_chunk_offsets(
+    moov: bytearray, start: int, end: int, low: int, high: int, shift: int
+) -> int:
+    """Add ``shift`` to every stco/co64 chunk offset in [low, high); returns tables patched."""
+    import numpy as np
+
+    patched = 0
+    for atom_type, offset, size, header_size in _iter_mp4_atoms(moov, start, end):
+        body = offset + header_size
+        if atom_type in MP4_OFFSET_CONTAINERS:
+            patched += _patch_chunk_offsets(moov, body, offset + size, low, high, shift)
+        elif atom_type in {"stco", "co64"}:
+            width = 4 if atom_type == "stco" else 8
+            count = int.from_bytes(moov[body + 4 : body + 8], "big")
+            if body + 8 + count * width > offset + size:
+                raise FaststartUnsupported(f"truncated {atom_type} table")
+            table = np.frombuffer(
+                moov, dtype=">u4" if width == 4 else ">u8", count=count, offset=body + 8
+            )
+            values = table.astype(np.uint64)
+            values[(values >= low) & (values < high)] += np.uint64(shift)
+            if width == 4 and count and int(values.max()) > 0xFFFFFFFF:
+                # growing stco into co64 would resize every parent atom
+                raise FaststartUnsupported("chunk offsets overflow 32-bit stco")
+            table[:] = values
+            patched += 1
+        elif atom_type in MP4_UNSUPPORTED_ATOMS:
+            raise FaststartUnsupported(f"{atom_type} atom is not supported")
+    return patched
+
+
+def _relocate_moov(source: Path, output: Path, cancel: Event | None = None) -> None:
+    """Write ``source`` to ``output`` with moov moved ahead of the first mdat."""
+    with source.open("rb") as handle, mmap.mmap(
+        handle.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        atoms = list(_iter_mp4_atoms(buffer, 0, len(buffer)))
+        types = [atom[0] for atom in atoms]
+        if types.count("moov") != 1 or "mdat" not in types or "moof" in types:
+            raise FaststartUnsupported("expected one moov, an mdat and no fragments")
+        mdat_start = atoms[types.index("mdat")][1]
+        _, moov_start, moov_size, moov_header = atoms[types.index("moov")]
+        moov_end = moov_start + moov_size
+
+        moov = bytearray(buffer[moov_start:moov_end])
+        if not _patch_chunk_offsets(
+            moov, moov_header, moov_size, mdat_start, moov_start, moov_size
+        ):
+            raise FaststartUnsupported("moov has no chunk offset tables")
 
+        view = memoryview(buffer)
+        try:
+            with output.open("wb") as target:
+                target.write(view[:mdat_start])
+                target.write(moov)
+                for range_start, range_end in (
+                    (mdat_start, moov_start),
+                    (moov_end, len(buffer)),
+                ):
+                    for chunk_start in range(range_start, range_end, FASTSTART_COPY_CHUNK_BYTES):
+                        _check_cancelled(cancel)
+                        chunk_end = min(chunk_start + FASTSTART_COPY_CHUNK_BYTES, range_end)
+                        target.write(view[chunk_start:chunk_end])
+        finally:
+            view.release()
 
-def _has_faststart(path: Path) -> bool:
-    atoms = _read_mp4_atom_positions(path)
-    moov = atoms.get("moov")
-    mdat = atoms.get("mdat")
-    if moov is None or mdat is None:
-        raise ValueError("media is missing top-level moov or mdat atom")
-    return moov < mdat
 
+def _is_faststart_compatible(path: Path) -> bool:
+    return path.suffix.lower() in {".mp4", ".m4v", ".mov"}
 
-def _optimize_faststart(source: Path) -> tuple[Path, dict]:
+
+def _optimize_faststart(
+    media: MediaInfo,
+    cancel: Event | None = None,
+) -> tuple[MediaInfo, dict]:
+    source = media.path
     if not FASTSTART_ENABLED:
-        return source, {"status": "disabled", "was_optimized": False}
+        return media, {"status": "disabled", "was_optimized": False}
     if not _is_faststart_compatible(source):
-        return source, {"status": "not_applicable", "was_optimized": False}
-    if _has_faststart(source):
-        return source, {"status": "already_optimized", "was_optimized": False}
+        return media, {"status": "not_applicable", "was_optimized": False}
+    if media.faststart is None:
+        raise ValueError("media is missing top-level moov or mdat atom")
+    if media.faststart:
+        return media, {"status": "already_optimized", "was_optimized": False}
 
     fd, name = tempfile.mkstemp(
         prefix="studify-faststart-",
@@ -254,54 +1147,73 @@ def _optimize_faststart(source: Path) -> tuple[Path, dict]:
     os.close(fd)
     output = Path(name)
     started = time.monotonic()
+    method = "ffmpeg"
     try:
-        result = subprocess.run(
-            [
-                "ffmpeg",
-                "-nostdin",
-                "-y",
-                "-i",
-                str(source),
-                "-map",
-                "0",
-                "-c",
-                "copy",
-                "-movflags",
-                "+faststart",
-                str(output),
-            ],
-            capture_output=True,
-            timeout=FFMPEG_TIMEOUT_SECONDS,
-            check=False,
-        )
-        if result.returncode != 0:
-            error = result.stderr.decode("utf-8", errors="replace")[-2000:]
-            raise RuntimeError(f"faststart ffmpeg failed: {error}")
-        _validate_media(output)
-        if not _has_faststart(output):
-            raise RuntimeError("ffmpeg output still has moov after mdat")
-        return output, {
+        if FASTSTART_NATIVE:
+            try:
+                _relocate_moov(source, output, cancel)
+                method = "native"
+            except FaststartUnsupported as error:
+                logging.info("Native faststart skipped for %s: %s", source.name, error)
+        if method == "ffmpeg":
+            _remux_faststart(source, output, cancel)
+            # ffmpeg may drop or reorder streams on exotic inputs; the native copy cannot.
+            optimized = _probe_media(output, cancel)
+            if not optimized.faststart:
+                raise RuntimeError("ffmpeg faststart output still has moov after mdat")
+        else:
+            optimized = dataclasses.replace(
+                media, path=output, size=output.stat().st_size, faststart=True
+            )
+        return optimized, {
             "status": "optimized",
             "was_optimized": True,
+            "method": method,
             "processing_ms": round((time.monotonic() - started) * 1000),
-            "original_size": source.stat().st_size,
-            "optimized_size": output.stat().st_size,
+            "original_size": media.size,
+            "optimized_size": optimized.size,
         }
     except Exception:
         output.unlink(missing_ok=True)
         raise
 
 
-def _upload_optimized_to_mega(path: Path, attachment_id: int) -> str:
+def _remux_faststart(source: Path, output: Path, cancel: Event | None = None) -> None:
+    result = _run_process(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-y",
+            "-i",
+            str(source),
+            "-map",
+            "0",
+            "-c",
+            "copy",
+            "-movflags",
+            "+faststart",
+            str(output),
+        ],
+        FFMPEG_TIMEOUT_SECONDS,
+        cancel,
+    )
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="replace")[-2000:]
+        raise RuntimeError(f"faststart ffmpeg failed: {error}")
+
+
+def _upload_optimized_to_mega(
+    path: Path,
+    attachment_id: int,
+    cancel: Event | None = None,
+) -> str:
     if not MEGA_EMAIL or not MEGA_PASSWORD:
         raise RuntimeError("MEGA_EMAIL and MEGA_PASSWORD are required for Fast Start upload")
     upload_name = f"studify-video-{attachment_id}-faststart.mp4"
     upload_path = path.with_name(upload_name)
     shutil.copyfile(path, upload_path)
     try:
-        account = Mega().login(MEGA_EMAIL, MEGA_PASSWORD)
-        uploaded = account.upload(str(upload_path))
-        return str(account.get_upload_link(uploaded))
+        return _run_mega(MEGA_UPLOAD_SCRIPT, str(upload_path), cancel=cancel)
     finally:
         upload_path.unlink(missing_ok=True)
 
@@ -339,18 +1251,20 @@ def _persist_faststart_result(
         ).eq("id", queue_id).execute()
 
 
-def _convert_to_wav(source: Path) -> Path:
+def _convert_to_wav(media: MediaInfo, cancel: Event | None = None) -> Path:
     fd, name = tempfile.mkstemp(prefix="studify-asr-", suffix=".wav", dir=TEMP_DIR)
     os.close(fd)
     output = Path(name)
     try:
-        result = subprocess.run(
+        result = _run_process(
             [
                 "ffmpeg",
                 "-nostdin",
                 "-y",
                 "-i",
-                str(source),
+                str(media.path),
+                "-map",
+                f"0:{media.audio_index}" if media.audio_index is not None else "0:a:0",
                 "-vn",
                 "-ar",
                 "16000",
@@ -360,9 +1274,8 @@ def _convert_to_wav(source: Path) -> Path:
                 "pcm_s16le",
                 str(output),
             ],
-            capture_output=True,
-            timeout=FFMPEG_TIMEOUT_SECONDS,
-            check=False,
+            FFMPEG_TIMEOUT_SECONDS,
+            cancel,
         )
         if result.returncode != 0:
             error = result.stderr.decode("utf-8", errors="replace")[-2000:]
@@ -373,6 +1286,12 @@ def _convert_to_wav(source: Path) -> Path:
         raise
 
 
+def _update_realtime_factor(observed: float) -> None:
+    global asr_realtime_factor
+    # Exponential moving average, so one unusual job does not swing the estimate.
+    asr_realtime_factor = 0.8 * asr_realtime_factor + 0.2 * observed
+
+
 def _segment_confidence(avg_logprob: float | None) -> float | None:
     if avg_logprob is None:
         return None
@@ -382,55 +1301,372 @@ def _segment_confidence(avg_logprob: float | None) -> float | None:
     return max(0.0, min(1.0, math.exp(avg_logprob)))
 
 
+def _estimate_model_bytes(model_path: str, compute_type: str) -> int:
+    # Converted checkpoints are stored as float16; int8 variants halve that.
+    weights = Path(model_path) / "model.bin"
+    size = weights.stat().st_size if weights.exists() else 0
+    if compute_type.startswith("int8"):
+        return size // 2
+    if compute_type == "float32":
+        return size * 2
+    return size
+
+
+@dataclasses.dataclass
+class _RoutedModel:
+    whisper: WhisperModel
+    estimated_bytes: int
+    # Jobs currently transcribing with this model; it is only evicted at zero.
+    users: int = 0
+
+
+def _acquire_routed_model(size: str, compute_type: str) -> WhisperModel:
+    """Return a cached routed model, loading it once; pair with _release_routed_model."""
+    key = (size, compute_type)
+    while True:
+        with routed_models_lock:
+            cached = routed_models.get(key)
+            if cached is not None:
+                routed_models.move_to_end(key)
+                cached.users += 1
+                return cached.whisper
+            loading = routed_model_loads.get(key)
+            if loading is None:
+                loading = routed_model_loads[key] = Future()
+                break
+        # Another job is loading this model; look it up again once it is cached.
+        loading.result()
+
+    # Load outside the lock so jobs using other cached models are not blocked.
+    try:
+        model_path = download_model(size)
+        loaded = WhisperModel(model_path, device=DEVICE, compute_type=compute_type)
+        estimated = _estimate_model_bytes(model_path, compute_type)
+    except BaseException as error:
+        with routed_models_lock:
+            routed_model_loads.pop(key, None)
+        loading.set_exception(error)
+        raise
+    logging.info(
+        "Loaded routed Whisper model=%s compute_type=%s (~%s MiB)",
+        size,
+        compute_type,
+        estimated // (1024 * 1024),
+    )
+    with routed_models_lock:
+        routed_models[key] = _RoutedModel(loaded, estimated, users=1)
+        routed_model_loads.pop(key, None)
+        _evict_routed_models()
+    loading.set_result(None)
+    return loaded
+
+
+def _release_routed_model(whisper: WhisperModel) -> None:
+    with routed_models_lock:
+        for cached in routed_models.values():
+            if cached.whisper is whisper:
+                cached.users -= 1
+                break
+        _evict_routed_models()
+
+
+def _evict_routed_models() -> None:
+    # Caller holds routed_models_lock.
+    total = sum(cached.estimated_bytes for cached in routed_models.values())
+    for key in list(routed_models):
+        if total <= MODEL_CACHE_BYTES or len(routed_models) <= 1:
+            break
+        cached = routed_models[key]
+        if cached.users > 0:
+            continue
+        del routed_models[key]
+        total -= cached.estimated_bytes
+        _stop_batch_engine(cached.whisper)
+        logging.info("Evicted routed Whisper model=%s compute_type=%s", *key)
+
+
+@dataclasses.dataclass
+class _BatchWindow:
+    key: tuple
+    features: object
+    metadata: dict
+    tokenizer: object
+    options: object
+    future: Future
+
+
+class AsrBatchEngine:
+    """Decode VAD windows from concurrent jobs in shared batched forward passes."""
+
+    def __init__(self, whisper: WhisperModel):
+        self.pipeline = BatchedInferencePipeline(whisper)
+        self.pending: list[_BatchWindow] = []
+        self.condition = Condition()
+        self.stopped = False
+        self.thread = Thread(target=self._run, name="asr-batch-engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, features, tokenizer, chunks_metadata, options) -> list:
+        key = (
+            tokenizer.task,
+            tokenizer.language_code,
+            repr(dataclasses.replace(options, clip_timestamps=None)),
+        )
+        windows = [
+            _BatchWindow(key, feature, metadata, tokenizer, options, Future())
+            for feature, metadata in zip(features, chunks_metadata)
+        ]
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("ASR batch engine is stopped")
+            self.pending.extend(windows)
+            self.condition.notify_all()
+        return [window.future.result() for window in windows]
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def _next_batch(self) -> list[_BatchWindow]:
+        with self.condition:
+            while not self.pending and not self.stopped:
+                self.condition.wait()
+            if not self.pending:
+                return []
+            # Give other jobs a moment to contribute windows to this batch.
+            deadline = time.monotonic() + ASR_BATCH_WAIT_MS / 1000
+            while len(self.pending) < ASR_BATCH_SIZE and not self.stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            key = self.pending[0].key
+            batch = [window for window in self.pending if window.key == key]
+            batch = batch[:ASR_BATCH_SIZE]
+            selected = {id(window) for window in batch}
+            self.pending = [
+                window for window in self.pending if id(window) not in selected
+            ]
+            return batch
+
+    def _run(self) -> None:
+        import numpy as np
+
+        while batch := self._next_batch():
+            # Windows from different jobs must not inherit each other's last speech end.
+            self.pipeline.last_speech_timestamp = 0.0
+            try:
+                outputs = self.pipeline.forward(
+                    np.stack([window.features for window in batch]),
+                    batch[0].tokenizer,
+                    [window.metadata for window in batch],
+                    batch[0].options,
+                )
+                for window, output in zip(batch, outputs):
+                    window.future.set_result(output)
+            except Exception as error:
+                for window in batch:
+                    window.future.set_exception(error)
+
+
+class _EngineBackedPipeline(BatchedInferencePipeline):
+    def __init__(self, engine: AsrBatchEngine):
+        super().__init__(engine.pipeline.model)
+        self.engine = engine
+
+    def forward(self, features, tokenizer, chunks_metadata, options):
+        return self.engine.submit(features, tokenizer, chunks_metadata, options)
+
+
+def _get_batch_engine(whisper: WhisperModel) -> AsrBatchEngine:
+    with batch_engines_lock:
+        engine = batch_engines.get(id(whisper))
+        if engine is None:
+            engine = AsrBatchEngine(whisper)
+            batch_engines[id(whisper)] = engine
+        return engine
+
+
+def _stop_batch_engine(whisper: WhisperModel) -> None:
+    with batch_engines_lock:
+        engine = batch_engines.pop(id(whisper), None)
+    if engine is not None:
+        engine.stop()
+
+
+def _read_wav_prefix(wav: Path, seconds: float):
+    import numpy as np
+
+    with wave.open(str(wav), "rb") as reader:
+        frames = reader.readframes(int(reader.getframerate() * seconds))
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _route_model(audio) -> tuple[WhisperModel, str | None, str]:
+    """Return (model, forced language, label) from a language probe on the first seconds."""
+    assert model is not None
+    default_label = f"{MODEL_SIZE}:{COMPUTE_TYPE}"
+    if not language_routes:
+        return model, None, default_label
+    probe = (
+        _read_wav_prefix(audio, LANGUAGE_PROBE_SECONDS)
+        if isinstance(audio, Path)
+        else audio[: int(16000 * LANGUAGE_PROBE_SECONDS)]
+    )
+    if not probe.size:
+        return model, None, default_label
+    language, probability, _ = model.detect_language(audio=probe)
+    route = language_routes.get(language)
+    if route is None or probability < LANGUAGE_ROUTE_MIN_PROBABILITY:
+        logging.info(
+            "Language probe %s (p=%.2f); using default model",
+            language,
+            probability,
+        )
+        return model, None, default_label
+    size, compute_type = route
+    logging.info(
+        "Language probe %s (p=%.2f); routing to model=%s compute_type=%s",
+        language,
+        probability,
+        size,
+        compute_type,
+    )
+    if route == (MODEL_SIZE, COMPUTE_TYPE):
+        return model, language, default_label
+    return _acquire_routed_model(size, compute_type), language, f"{size}:{compute_type}"
+
+
 def _transcribe_sync(
-    source: Path,
+    media: MediaInfo,
     task: Literal["transcribe", "translate"],
     beam_size: int,
+    profile: Literal["fast", "accurate"] | None = None,
+    cancel: Event | None = None,
 ) -> TranscriptResult:
     if model is None:
         raise RuntimeError("Whisper model is not ready")
 
-    _validate_media(source)
-    wav = _convert_to_wav(source)
+    if media.is_asr_ready:
+        wav = media.path
+    else:
+        with STAGE_SECONDS.labels("wav_conversion").time():
+            wav = _convert_to_wav(media, cancel)
     try:
-        segment_iter, info = model.transcribe(
-            str(wav),
+        return _transcribe_audio(wav, task, beam_size, profile, cancel)
+    finally:
+        if wav != media.path:
+            wav.unlink(missing_ok=True)
+
+
+def _decode_segments(
+    whisper: WhisperModel,
+    asr_input,
+    language: str | None,
+    task: Literal["transcribe", "translate"],
+    beam_size: int,
+    profile: Literal["fast", "accurate"] | None,
+    cancel: Event | None,
+) -> tuple[list[TranscriptSegment], list[str], object]:
+    decode_options = {
+        "beam_size": beam_size,
+        "word_timestamps": False,
+        "without_timestamps": False,
+        **DECODE_PROFILES.get(profile or "", {}),
+    }
+    if BATCHED_INFERENCE:
+        pipeline = _EngineBackedPipeline(_get_batch_engine(whisper))
+        segment_iter, info = pipeline.transcribe(
+            asr_input,
+            language=language,
             task=task,
-            beam_size=beam_size,
             vad_filter=True,
-            word_timestamps=True,
+            batch_size=ASR_BATCH_SIZE,
+            **decode_options,
         )
-        segments: list[TranscriptSegment] = []
-        texts: list[str] = []
-        for segment in segment_iter:
-            text = segment.text.strip()
-            if not text:
-                continue
-            texts.append(text)
-            segments.append(
-                TranscriptSegment(
-                    text=text,
-                    start=round(float(segment.start), 3),
-                    end=round(float(segment.end), 3),
-                    confidence=_segment_confidence(
-                        getattr(segment, "avg_logprob", None)
-                    ),
-                )
+    else:
+        segment_iter, info = whisper.transcribe(
+            asr_input,
+            language=language,
+            task=task,
+            vad_filter=True,
+            **decode_options,
+        )
+    segments: list[TranscriptSegment] = []
+    texts: list[str] = []
+    for segment in segment_iter:
+        if cancel is not None and cancel.is_set():
+            # Segments are decoded lazily; closing the generator stops the remaining windows.
+            segment_iter.close()
+            raise JobCancelled("job was cancelled")
+        text = segment.text.strip()
+        if not text:
+            continue
+        texts.append(text)
+        segments.append(
+            TranscriptSegment(
+                text=text,
+                start=round(float(segment.start), 3),
+                end=round(float(segment.end), 3),
+                confidence=_segment_confidence(
+                    getattr(segment, "avg_logprob", None)
+                ),
+                words=(
+                    [
+                        (round(word.start, 3), round(word.end, 3), word.word)
+                        for word in segment.words
+                    ]
+                    if segment.words
+                    else None
+                ),
             )
-
-        duration = (
-            max((segment.end for segment in segments), default=0.0)
-            or float(getattr(info, "duration", 0.0) or 0.0)
         )
-        return TranscriptResult(
-            text=" ".join(texts).strip(),
-            language=getattr(info, "language", None),
-            language_probability=getattr(info, "language_probability", None),
-            duration=round(duration, 3),
-            segments=segments,
+    return segments, texts, info
+
+
+def _transcribe_audio(
+    audio,
+    task: Literal["transcribe", "translate"],
+    beam_size: int,
+    profile: Literal["fast", "accurate"] | None = None,
+    cancel: Event | None = None,
+) -> TranscriptResult:
+    """Transcribe a 16 kHz mono WAV path or an in-memory float32 array."""
+    if model is None:
+        raise RuntimeError("Whisper model is not ready")
+
+    asr_input = str(audio) if isinstance(audio, Path) else audio
+    asr_started = time.monotonic()
+    whisper, language, model_label = _route_model(audio)
+    try:
+        segments, texts, info = _decode_segments(
+            whisper, asr_input, language, task, beam_size, profile, cancel
         )
     finally:
-        wav.unlink(missing_ok=True)
+        if whisper is not model:
+            _release_routed_model(whisper)
+
+    duration = (
+        max((segment.end for segment in segments), default=0.0)
+        or float(getattr(info, "duration", 0.0) or 0.0)
+    )
+    asr_seconds = time.monotonic() - asr_started
+    audio_seconds = float(getattr(info, "duration", 0.0) or duration)
+    STAGE_SECONDS.labels("asr").observe(asr_seconds)
+    ASR_AUDIO_SECONDS.inc(audio_seconds)
+    ASR_WALL_SECONDS.inc(asr_seconds)
+    if asr_seconds > 0 and audio_seconds > 0:
+        ASR_REALTIME_FACTOR.set(audio_seconds / asr_seconds)
+        _update_realtime_factor(audio_seconds / asr_seconds)
+    return TranscriptResult(
+        text=" ".join(texts).strip(),
+        language=getattr(info, "language", None),
+        language_probability=getattr(info, "language_probability", None),
+        duration=round(duration, 3),
+        segments=segments,
+        model=model_label,
+    )
 
 
 async def _embed_batch(
@@ -496,13 +1732,24 @@ async def _embed_batch(
     return embeddings
 
 
+async def _timed_embed_batch(
+    stage: str,
+    base_url: str,
+    texts: list[str],
+    expected_dimension: int,
+    task: Literal["query", "passage"] | None = None,
+) -> list[list[float]]:
+    with STAGE_SECONDS.labels(stage).time():
+        return await _embed_batch(base_url, texts, expected_dimension, task)
+
+
 async def _generate_embeddings(
     segments: list[TranscriptSegment],
 ) -> tuple[list[list[float]], list[list[float]]]:
     texts = [segment.text for segment in segments]
     e5_result, bge_result = await asyncio.gather(
-        _embed_batch(E5_EMBEDDING_URL, texts, 384, "passage"),
-        _embed_batch(BGE_EMBEDDING_URL, texts, 1024),
+        _timed_embed_batch("embedding_e5", E5_EMBEDDING_URL, texts, 384, "passage"),
+        _timed_embed_batch("embedding_bge", BGE_EMBEDDING_URL, texts, 1024),
         return_exceptions=True,
     )
     if isinstance(e5_result, Exception) and isinstance(bge_result, Exception):
@@ -527,11 +1774,39 @@ def _cosine_for_normalized(left: list[float], right: list[float]) -> float:
     return sum(a * b for a, b in zip(left, right))
 
 
+def _chunk_limits() -> tuple[int, int]:
+    if chunk_tokenizer is None:
+        return MIN_CHUNK_CHARS, MAX_CHUNK_CHARS
+    return MIN_CHUNK_TOKENS, MAX_CHUNK_TOKENS - chunk_token_overhead
+
+
+def _chunk_sizes(source: list[TranscriptSegment]) -> list[int]:
+    """Size of each segment in the units used by `_chunk_limits`."""
+    if chunk_tokenizer is None:
+        return [len(item.text) + 1 for item in source]
+    encodings = chunk_tokenizer.encode_batch(
+        [item.text.strip() for item in source],
+        add_special_tokens=False,
+    )
+    return [len(encoding.ids) for encoding in encodings]
+
+
+def _merge_words(
+    group: list[TranscriptSegment],
+) -> list[tuple[float, float, str]] | None:
+    if all(item.words is None for item in group):
+        return None
+    return [word for item in group for word in item.words or []]
+
+
 def _structural_chunk_segments(
     source: list[TranscriptSegment],
 ) -> list[TranscriptSegment]:
     chunks: list[TranscriptSegment] = []
     group: list[TranscriptSegment] = []
+    _, max_size = _chunk_limits()
+    sizes = _chunk_sizes(source)
+    group_size = 0
 
     def flush() -> None:
         if not group:
@@ -543,19 +1818,21 @@ def _structural_chunk_segments(
                 start=group[0].start,
                 end=group[-1].end,
                 confidence=sum(values) / len(values) if values else None,
+                words=_merge_words(group),
             )
         )
         group.clear()
 
-    for item in source:
-        candidate_length = sum(len(entry.text) + 1 for entry in group) + len(item.text)
+    for item, size in zip(source, sizes):
         gap = max(0.0, item.start - group[-1].end) if group else 0
         if group and (
-            candidate_length > MAX_CHUNK_CHARS
+            group_size + size > max_size
             or gap > MAX_SEGMENT_GAP_SECONDS
         ):
             flush()
+            group_size = 0
         group.append(item)
+        group_size += size
     flush()
     return chunks
 
@@ -580,6 +1857,9 @@ async def _semantic_chunk_segments(
         return _structural_chunk_segments(source)
     chunks: list[TranscriptSegment] = []
     group: list[TranscriptSegment] = [source[0]]
+    min_size, max_size = _chunk_limits()
+    sizes = _chunk_sizes(source)
+    current_size = sizes[0]
 
     def flush() -> None:
         if not group:
@@ -597,30 +1877,31 @@ async def _semantic_chunk_segments(
                     if confidence_values
                     else None
                 ),
+                words=_merge_words(group),
             )
         )
         group.clear()
 
     for index in range(1, len(source)):
         current = source[index]
-        current_length = sum(len(item.text) + 1 for item in group)
-        candidate_length = current_length + len(current.text) + 1
         similarity = _cosine_for_normalized(
             unit_embeddings[index - 1],
             unit_embeddings[index],
         )
         time_gap = max(0.0, current.start - group[-1].end)
         must_break = (
-            candidate_length > MAX_CHUNK_CHARS
+            current_size + sizes[index] > max_size
             or time_gap > MAX_SEGMENT_GAP_SECONDS
         )
         semantic_break = (
-            current_length >= MIN_CHUNK_CHARS
+            current_size >= min_size
             and similarity < SEMANTIC_SIMILARITY_THRESHOLD
         )
         if must_break or semantic_break:
             flush()
+            current_size = 0
         group.append(current)
+        current_size += sizes[index]
     flush()
     return chunks
 
@@ -744,11 +2025,17 @@ def _persist_completed_job(
             "progress_percentage": 100,
             "completed_at": now,
             "error_message": None,
+            "lease_owner": None,
+            "lease_expires_at": None,
             "step_data": {
                 "language": result.language,
                 "duration": result.duration,
                 "segment_count": len(rows),
                 "timestamp_source": "faster-whisper",
+                "asr_model": result.model,
+                "has_word_timestamps": any(
+                    segment.words is not None for segment in result.segments
+                ),
                 "faststart": faststart_result,
             },
         }
@@ -843,30 +2130,45 @@ def _create_embedding_ready_notification(
         )
 
 
-def _claim_queue(queue_id: int, attachment_id: int) -> None:
+def _claim_queue(queue_id: int, attachment_id: int) -> bool:
+    """Take the lease on a pushed row; False when another node already holds it."""
     if supabase is None:
         raise RuntimeError("Supabase client is not ready")
-    queue = supabase.table("video_processing_queue").select(
-        "id,attachment_id,status"
-    ).eq("id", queue_id).eq("attachment_id", attachment_id).single().execute()
-    if not queue.data:
-        raise ValueError("queue and attachment do not match")
-    supabase.table("video_processing_queue").update(
+    claimed = supabase.rpc(
+        "claim_video_processing_queue",
         {
-            "status": "processing",
-            "current_step": "transcribe",
-            "progress_percentage": 65,
-            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "error_message": None,
-        }
-    ).eq("id", queue_id).execute()
-    supabase.table("video_processing_steps").update(
+            "p_queue_id": queue_id,
+            "p_attachment_id": attachment_id,
+            "p_worker_id": WORKER_ID,
+            "p_lease_seconds": QUEUE_LEASE_SECONDS,
+        },
+    ).execute()
+    return bool(claimed.data)
+
+
+def _claim_next_job() -> dict | None:
+    """Claim the oldest pending transcription row, re-queueing expired leases first."""
+    if supabase is None:
+        raise RuntimeError("Supabase client is not ready")
+    claimed = supabase.rpc(
+        "claim_video_processing_job",
+        {"p_worker_id": WORKER_ID, "p_lease_seconds": QUEUE_LEASE_SECONDS},
+    ).execute()
+    return claimed.data[0] if claimed.data else None
+
+
+def _renew_lease(queue_id: int) -> bool:
+    if supabase is None:
+        raise RuntimeError("Supabase client is not ready")
+    renewed = supabase.rpc(
+        "renew_video_processing_lease",
         {
-            "status": "processing",
-            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "error_message": None,
-        }
-    ).eq("queue_id", queue_id).eq("step_name", "transcribe").execute()
+            "p_queue_id": queue_id,
+            "p_worker_id": WORKER_ID,
+            "p_lease_seconds": QUEUE_LEASE_SECONDS,
+        },
+    ).execute()
+    return bool(renewed.data)
 
 
 def _persist_failed_job(queue_id: int, attachment_id: int, error: str) -> None:
@@ -879,6 +2181,8 @@ def _persist_failed_job(queue_id: int, attachment_id: int, error: str) -> None:
             "status": "failed",
             "error_message": safe_error,
             "last_error_at": now,
+            "lease_owner": None,
+            "lease_expires_at": None,
         }
     ).eq("id", queue_id).eq("attachment_id", attachment_id).execute()
     supabase.table("video_processing_steps").update(
@@ -892,6 +2196,147 @@ def _persist_failed_job(queue_id: int, attachment_id: int, error: str) -> None:
     ).execute()
 
 
+def _estimate_disk_bytes(media: MediaInfo, attachment_id: int | None) -> int:
+    """Peak TEMP_DIR bytes of a job from its probe: source, Fast Start copies and WAV."""
+    wav = 0
+    if not media.is_asr_ready:
+        # Without a duration, assume 32 kbit/s audio, the low end for speech codecs.
+        duration = media.duration or media.size / 4000
+        wav = int(duration * WAV_BYTES_PER_SECOND)
+    if (
+        attachment_id is not None
+        and FASTSTART_ENABLED
+        and _is_faststart_compatible(media.path)
+        and media.faststart is False
+    ):
+        return 2 * media.size + max(media.size, wav)
+    return media.size + wav
+
+
+async def _admit_disk(job_id: str | None, size: int) -> DiskReservation | None:
+    if disk_budget is None:
+        return None
+    reservation = await disk_budget.admit(size)
+    with jobs_lock:
+        if job_id in jobs:
+            jobs[job_id]["disk_reserved_bytes"] = size
+    return reservation
+
+
+async def _stop_heartbeat(heartbeat: asyncio.Task | None) -> None:
+    # Called before any terminal write, which clears the lease a renewal would look for.
+    if heartbeat is None or heartbeat.done():
+        return
+    heartbeat.cancel()
+    await asyncio.wait([heartbeat])
+
+
+def _release_lease(queue_id: int) -> None:
+    """Expire this node's lease now, so the next claim re-queues the row."""
+    if supabase is None:
+        return
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    supabase.table("video_processing_queue").update({"lease_expires_at": now}).eq(
+        "id", queue_id
+    ).eq("lease_owner", WORKER_ID).execute()
+
+
+async def _settle_cancelled_job(
+    job_id: str, queue_id: int, attachment_id: int
+) -> None:
+    """Leave the queue row in a clear state after the job task was cancelled."""
+    reason = cancel_reasons.get(job_id)
+    if reason == "lease_lost":
+        return
+    try:
+        if reason == "requested":
+            # Failing the row keeps another node from re-queueing a job the user stopped.
+            await asyncio.to_thread(
+                _persist_failed_job, queue_id, attachment_id, "job was cancelled"
+            )
+        else:
+            # Shutdown: hand the row back instead of waiting out the lease.
+            await asyncio.to_thread(_release_lease, queue_id)
+    except Exception:
+        logging.exception("Failed to settle queue %s after cancelling job %s", queue_id, job_id)
+
+
+async def _heartbeat(job_id: str, queue_id: int, cancel: Event) -> None:
+    """Renew the queue lease while the job runs; abandon the job once the lease is lost."""
+    while True:
+        await asyncio.sleep(QUEUE_HEARTBEAT_SECONDS)
+        try:
+            renewed = await asyncio.to_thread(_renew_lease, queue_id)
+        except Exception:
+            # A missed heartbeat is fine; the lease outlives several of them.
+            logging.exception("Lease renewal failed for queue %s", queue_id)
+            continue
+        if not renewed:
+            logging.warning(
+                "Lost the lease on queue %s; cancelling job %s", queue_id, job_id
+            )
+            # The row belongs to another node now, so nothing is persisted for it here.
+            cancel_reasons[job_id] = "lease_lost"
+            with jobs_lock:
+                if job_id in jobs:
+                    jobs[job_id].update(
+                        status="failed",
+                        error="queue lease was lost to another worker",
+                        failed_at=time.time(),
+                    )
+            cancel.set()
+            task = tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+            return
+
+
+async def _worker_loop() -> None:
+    """Pull transcription rows from video_processing_queue while this node has capacity."""
+    logging.info("Worker %s pulling from video_processing_queue", WORKER_ID)
+    slots = asyncio.Semaphore(WORKER_MAX_JOBS)
+    while True:
+        await slots.acquire()
+        try:
+            claimed = await asyncio.to_thread(_claim_next_job)
+        except Exception:
+            logging.exception("Claiming from video_processing_queue failed")
+            claimed = None
+        if claimed is None:
+            slots.release()
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            continue
+        logging.info(
+            "Claimed queue %s (attachment %s, retry %s)",
+            claimed["queue_id"],
+            claimed["attachment_id"],
+            claimed.get("retry_count"),
+        )
+        job_id = _start_job(
+            None,
+            claimed["media_url"],
+            "transcribe",
+            WORKER_BEAM_SIZE,
+            claimed["queue_id"],
+            claimed["attachment_id"],
+        )
+        tasks[job_id].add_done_callback(lambda _: slots.release())
+
+
+async def _run_cancellable(cancel: Event, func, *args):
+    """asyncio.to_thread that sets the token on cancellation and waits for the worker to stop."""
+    work = asyncio.ensure_future(asyncio.to_thread(func, *args, cancel=cancel))
+    try:
+        return await asyncio.shield(work)
+    except asyncio.CancelledError:
+        cancel.set()
+        try:
+            await work
+        except Exception:
+            pass
+        raise
+
+
 def _cleanup_source(path: Path) -> None:
     try:
         parent = path.parent
@@ -910,28 +2355,86 @@ async def _run_job(
     beam_size: int,
     queue_id: int | None,
     attachment_id: int | None,
+    profile: Literal["fast", "accurate"] | None = None,
+    known_faststart: dict | None = None,
+    clip=None,
+    reservation: DiskReservation | None = None,
 ) -> None:
     original_source: Path | None = source
     optimized_source: Path | None = None
-    faststart_result: dict | None = None
+    faststart_result: dict | None = known_faststart
+    media: MediaInfo | None = None
+    cancel = Event()
+    cancel_tokens[job_id] = cancel
+    heartbeat = (
+        asyncio.create_task(_heartbeat(job_id, queue_id, cancel))
+        if queue_id is not None
+        else None
+    )
     try:
-        if source is None:
-            if not source_url:
-                raise RuntimeError("job has no media source")
-            source = await asyncio.to_thread(_download_mega, source_url)
-            original_source = source
-        if attachment_id is not None:
-            try:
-                optimized_source, faststart_result = await asyncio.to_thread(
-                    _optimize_faststart,
-                    source,
+        if clip is not None:
+            # Decoded in memory at upload; there is no file to download or probe.
+            clip_seconds = len(clip) / 16000
+            with jobs_lock:
+                jobs[job_id].update(
+                    media_duration=round(clip_seconds, 3),
+                    estimated_asr_seconds=round(
+                        clip_seconds / max(asr_realtime_factor, 0.01), 1
+                    ),
                 )
-                if faststart_result.get("was_optimized"):
-                    optimized_url = await asyncio.to_thread(
-                        _upload_optimized_to_mega,
-                        optimized_source,
-                        attachment_id,
+        else:
+            if source is None:
+                if not source_url:
+                    raise RuntimeError("job has no media source")
+                # The size is unknown until the file arrives; the download is capped here.
+                reservation = await _admit_disk(job_id, MAX_UPLOAD_BYTES)
+                with STAGE_SECONDS.labels("download").time():
+                    source = await _run_cancellable(cancel, _download_mega, source_url)
+                original_source = source
+            # The only ffprobe for this source, so bad media fails before any other stage.
+            with STAGE_SECONDS.labels("validate").time():
+                media = await _run_cancellable(cancel, _probe_media, source)
+            with jobs_lock:
+                jobs[job_id].update(
+                    media_duration=media.duration,
+                    estimated_asr_seconds=media.estimated_asr_seconds(),
+                )
+            disk_bytes = _estimate_disk_bytes(media, attachment_id)
+            if reservation is None:
+                reservation = await _admit_disk(job_id, disk_bytes)
+            else:
+                await reservation.resize(disk_bytes)
+                with jobs_lock:
+                    jobs[job_id]["disk_reserved_bytes"] = disk_bytes
+        if attachment_id is not None and (media is None or known_faststart is not None):
+            # Decided at upload (or the clip is not MP4/MOV); the original was not kept.
+            faststart_result = known_faststart or {
+                "status": "not_applicable" if FASTSTART_ENABLED else "disabled",
+                "was_optimized": False,
+            }
+            await asyncio.to_thread(
+                _persist_faststart_result,
+                attachment_id,
+                queue_id,
+                faststart_result,
+            )
+        elif attachment_id is not None:
+            try:
+                with STAGE_SECONDS.labels("faststart").time():
+                    optimized, faststart_result = await _run_cancellable(
+                        cancel,
+                        _optimize_faststart,
+                        media,
                     )
+                optimized_source = optimized.path
+                if faststart_result.get("was_optimized"):
+                    with STAGE_SECONDS.labels("faststart_upload").time():
+                        optimized_url = await _run_cancellable(
+                            cancel,
+                            _upload_optimized_to_mega,
+                            optimized_source,
+                            attachment_id,
+                        )
                     await asyncio.to_thread(
                         _persist_faststart_result,
                         attachment_id,
@@ -940,6 +2443,7 @@ async def _run_job(
                         optimized_url,
                     )
                     source = optimized_source
+                    media = optimized
                 else:
                     await asyncio.to_thread(
                         _persist_faststart_result,
@@ -963,29 +2467,53 @@ async def _run_job(
                     queue_id,
                     faststart_result,
                 )
-        assert semaphore is not None
-        async with semaphore:
+        if clip is not None and len(clip) / 16000 <= SHORT_CLIP_MAX_SECONDS:
+            assert short_clip_semaphore is not None
+            lane, lane_name = short_clip_semaphore, "short_clip"
+        else:
+            assert semaphore is not None
+            lane, lane_name = semaphore, "default"
+        wait_started = time.monotonic()
+        async with lane:
+            if lane is semaphore:
+                SEMAPHORE_WAIT_SECONDS.observe(time.monotonic() - wait_started)
             with jobs_lock:
-                jobs[job_id]["status"] = "processing"
-            result = await asyncio.to_thread(
-                _transcribe_sync,
-                source,
-                task,
-                beam_size,
-            )
+                jobs[job_id].update(status="processing", lane=lane_name)
+            if clip is not None:
+                result = await _run_cancellable(
+                    cancel,
+                    _transcribe_audio,
+                    clip,
+                    task,
+                    beam_size,
+                    profile,
+                )
+            else:
+                assert media is not None
+                result = await _run_cancellable(
+                    cancel,
+                    _transcribe_sync,
+                    media,
+                    task,
+                    beam_size,
+                    profile,
+                )
 
         if queue_id is not None and attachment_id is not None:
-            result.segments = await _semantic_chunk_segments(result.segments)
+            with STAGE_SECONDS.labels("semantic_chunking").time():
+                result.segments = await _semantic_chunk_segments(result.segments)
             e5_embeddings, bge_embeddings = await _generate_embeddings(result.segments)
-            await asyncio.to_thread(
-                _persist_completed_job,
-                queue_id,
-                attachment_id,
-                result,
-                e5_embeddings,
-                bge_embeddings,
-                faststart_result,
-            )
+            await _stop_heartbeat(heartbeat)
+            with STAGE_SECONDS.labels("persistence").time():
+                await asyncio.to_thread(
+                    _persist_completed_job,
+                    queue_id,
+                    attachment_id,
+                    result,
+                    e5_embeddings,
+                    bge_embeddings,
+                    faststart_result,
+                )
 
         with jobs_lock:
             jobs[job_id].update(
@@ -993,6 +2521,7 @@ async def _run_job(
                 result=result.model_dump(),
                 completed_at=time.time(),
             )
+        JOBS_FINISHED.labels("completed").inc()
 
     except Exception as error:
         logging.exception("ASR job %s failed", job_id)
@@ -1002,7 +2531,9 @@ async def _run_job(
                 error=str(error),
                 failed_at=time.time(),
             )
+        JOBS_FINISHED.labels("failed").inc()
         if queue_id is not None and attachment_id is not None:
+            await _stop_heartbeat(heartbeat)
             try:
                 await asyncio.to_thread(
                     _persist_failed_job,
@@ -1012,6 +2543,11 @@ async def _run_job(
                 )
             except Exception:
                 logging.exception("Failed to persist failure state for job %s", job_id)
+    except asyncio.CancelledError:
+        if queue_id is not None and attachment_id is not None:
+            await _stop_heartbeat(heartbeat)
+            await _settle_cancelled_job(job_id, queue_id, attachment_id)
+        raise
     finally:
         if source is not None:
             _cleanup_source(source)
@@ -1023,16 +2559,74 @@ async def _run_job(
             and optimized_source != original_source
         ):
             _cleanup_source(optimized_source)
+        if heartbeat is not None:
+            heartbeat.cancel()
+        if reservation is not None:
+            await reservation.release()
         tasks.pop(job_id, None)
+        cancel_tokens.pop(job_id, None)
+        cancel_reasons.pop(job_id, None)
         _cleanup_stale_jobs()
 
 
+def _queue_job_active(queue_id: int) -> bool:
+    with jobs_lock:
+        return any(
+            job.get("queue_id") == queue_id
+            and job.get("status") not in {"completed", "failed"}
+            for job in jobs.values()
+        )
+
+
+def _start_job(
+    source: Path | None,
+    source_url: str | None,
+    task: Literal["transcribe", "translate"],
+    beam_size: int,
+    queue_id: int | None,
+    attachment_id: int | None,
+    profile: Literal["fast", "accurate"] | None = None,
+    known_faststart: dict | None = None,
+    clip=None,
+    reservation: DiskReservation | None = None,
+) -> str:
+    job_id = str(uuid.uuid4())
+    with jobs_lock:
+        jobs[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "queue_id": queue_id,
+            "attachment_id": attachment_id,
+            "profile": profile,
+        }
+        if reservation is not None:
+            jobs[job_id]["disk_reserved_bytes"] = reservation.size
+    tasks[job_id] = asyncio.create_task(
+        _run_job(
+            job_id,
+            source,
+            source_url,
+            task,
+            beam_size,
+            queue_id,
+            attachment_id,
+            profile,
+            known_faststart,
+            clip,
+            reservation,
+        )
+    )
+    return job_id
+
+
 @app.post("/transcribe", status_code=202)
 async def transcribe(
-    file: UploadFile | None = File(default=None),
+    request: Request,
     url: str | None = Query(default=None),
     task: Literal["transcribe", "translate"] = Query(default="transcribe"),
     beam_size: int = Query(default=5, ge=1, le=10),
+    profile: Literal["fast", "accurate"] | None = Query(default=None),
     queue_id: int | None = Query(default=None, ge=1),
     attachment_id: int | None = Query(default=None, ge=1),
     authorization: str | None = Header(default=None),
@@ -1046,44 +2640,89 @@ async def transcribe(
     )
     if not hmac.compare_digest(supplied_token, WHISPER_API_TOKEN):
         raise HTTPException(401, "unauthorized")
+    if not ready:
+        raise HTTPException(503, "service is starting")
 
-    if bool(file) == bool(url):
+    has_file = request.headers.get("content-type", "").startswith("multipart/form-data")
+    if has_file == bool(url):
         raise HTTPException(400, "provide exactly one of file or url")
+    try:
+        content_length = int(request.headers.get("content-length", ""))
+    except ValueError:
+        content_length = None
     if (queue_id is None) != (attachment_id is None):
         raise HTTPException(400, "queue_id and attachment_id must be provided together")
-    if queue_id is not None and attachment_id is not None:
-        try:
-            await asyncio.to_thread(_claim_queue, queue_id, attachment_id)
-        except Exception as error:
-            raise HTTPException(409, f"cannot claim processing queue: {error}") from error
 
-    source: Path | None = None
-    if not url:
-        assert file is not None
-        source = await _save_upload(file)
+    if queue_id is not None and _queue_job_active(queue_id):
+        # A repeated push for a row this node is already transcribing.
+        return JSONResponse(
+            status_code=202,
+            content={"status": "already_claimed", "queue_id": queue_id},
+        )
 
-    job_id = str(uuid.uuid4())
-    with jobs_lock:
-        jobs[job_id] = {
-            "job_id": job_id,
-            "status": "queued",
-            "created_at": time.time(),
-            "queue_id": queue_id,
-            "attachment_id": attachment_id,
-        }
+    # Reserved before the body is read; a request that does not fit is turned away unread.
+    reservation: DiskReservation | None = None
+    if has_file:
+        if content_length is not None and content_length > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_BYTES:
+            raise HTTPException(413, "uploaded media exceeds size limit")
+        if disk_budget is not None:
+            reservation = await disk_budget.try_admit(
+                min(content_length or MAX_UPLOAD_BYTES, MAX_UPLOAD_BYTES)
+            )
+            if reservation is None:
+                raise HTTPException(
+                    429, "temp disk budget is spent", headers={"Retry-After": "30"}
+                )
+    source: Path | None = None
+    known_faststart: dict | None = None
+    clip = None
+    try:
+        if queue_id is not None and attachment_id is not None:
+            try:
+                claimed = await asyncio.to_thread(_claim_queue, queue_id, attachment_id)
+            except Exception as error:
+                raise HTTPException(
+                    409, f"cannot claim processing queue: {error}"
+                ) from error
+            if not claimed:
+                # A worker pulled this row first and holds a live lease; it will finish it.
+                if reservation is not None:
+                    await reservation.release()
+                return JSONResponse(
+                    status_code=202,
+                    content={"status": "already_claimed", "queue_id": queue_id},
+                )
 
-    background = asyncio.create_task(
-        _run_job(
-            job_id,
-            source,
-            url,
-            task,
-            beam_size,
-            queue_id,
-            attachment_id,
-        )
+        if has_file:
+            upload = StreamedUpload(request)
+            await upload.start()
+            if content_length is None or content_length <= SHORT_CLIP_MAX_BYTES:
+                source, clip, known_faststart = await _ingest_short_clip(
+                    upload, attachment_id
+                )
+            else:
+                source, known_faststart = await _ingest_upload(upload, attachment_id)
+    except BaseException:
+        if reservation is not None:
+            await reservation.release()
+        raise
+    if clip is not None and reservation is not None:
+        # Decoded in memory; nothing of this job is on disk.
+        await reservation.release()
+        reservation = None
+
+    job_id = _start_job(
+        source,
+        url,
+        task,
+        beam_size,
+        queue_id,
+        attachment_id,
+        profile,
+        known_faststart,
+        clip,
+        reservation,
     )
-    tasks[job_id] = background
     return JSONResponse(
         status_code=202,
         content={
@@ -1122,8 +2761,12 @@ async def delete_job(
 ):
     if not WHISPER_API_TOKEN or authorization != f"Bearer {WHISPER_API_TOKEN}":
         raise HTTPException(401, "unauthorized")
+    token = cancel_tokens.get(job_id)
+    if token is not None:
+        token.set()
     task = tasks.get(job_id)
     if task and not task.done():
+        cancel_reasons.setdefault(job_id, "requested")
         task.cancel()
     with jobs_lock:
         jobs.pop(job_id, None)
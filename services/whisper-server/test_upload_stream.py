@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Upload streaming test: the file field reaches ffmpeg while the request body is still arriving.
+
+Needs ffmpeg on PATH:  python test_upload_stream.py  (or: pytest test_upload_stream.py)
+"""
+import asyncio
+import io
+import wave
+
+from starlette.requests import Request
+
+import app
+
+BOUNDARY = "studify-test-boundary"
+BODY_CHUNK_BYTES = 16 * 1024
+
+
+def _wav(seconds):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(16000)
+        output.writeframes(b"\0\0" * 16000 * seconds)
+    return buffer.getvalue()
+
+
+def _multipart(data):
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="lecture.wav"\r\n'
+        "Content-Type: audio/wav\r\n\r\n"
+    ).encode() + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def test_upload_reaches_ffmpeg_while_streaming():
+    body = _multipart(_wav(4))
+    chunks = [body[i : i + BODY_CHUNK_BYTES] for i in range(0, len(body), BODY_CHUNK_BYTES)]
+    received = 0
+    received_at_first_write = []
+
+    async def receive():
+        nonlocal received
+        await asyncio.sleep(0)
+        received += 1
+        return {
+            "type": "http.request",
+            "body": chunks[received - 1],
+            "more_body": received < len(chunks),
+        }
+
+    spawn = asyncio.create_subprocess_exec
+
+    async def spawn_and_watch(*args, **kwargs):
+        process = await spawn(*args, **kwargs)
+        write = process.stdin.write
+
+        def watched_write(data):
+            if not received_at_first_write:
+                received_at_first_write.append(received)
+            write(data)
+
+        process.stdin.write = watched_write
+        return process
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/transcribe",
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+
+    async def ingest():
+        upload = app.StreamedUpload(Request(scope, receive))
+        await upload.start()
+        return await app._ingest_upload(upload, None)
+
+    asyncio.create_subprocess_exec = spawn_and_watch
+    try:
+        source, _ = asyncio.run(ingest())
+    finally:
+        asyncio.create_subprocess_exec = spawn
+    try:
+        assert received_at_first_write[0] < len(chunks)
+        assert received == len(chunks)
+        with wave.open(str(source)) as output:
+            assert output.getnframes() == 16000 * 4
+    finally:
+        source.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    print("🧪 Testing upload streaming...")
+    test_upload_reaches_ffmpeg_while_streaming()
+    print("✅ ffmpeg reads the upload before the body has arrived")